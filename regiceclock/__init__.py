@@ -24,3 +24,11 @@
 # SOFTWARE.
 
 from regiceclock.clock import *
+from regiceclock.snapshot import *
+from regiceclock.stats import *
+from regiceclock.compiled import *
+from regiceclock.batch import *
+from regiceclock.fleet import *
+from regiceclock.aio import *
+from regiceclock.description import *
+from regiceclock.cache import *
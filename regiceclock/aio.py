@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+    Provide classes to read registers from asyncio code.
+
+    A reader reads one register asynchronously. The registers used by
+    clocks are read concurrently into a snapshot, and the clocks are
+    then evaluated from the snapshot, without blocking on the device.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from regiceclock.snapshot import Snapshot
+
+__all__ = ['ThreadedReader', 'ClientReader', 'read_snapshot']
+
+class ThreadedReader:
+    """
+        A reader reading the registers from a thread pool
+
+        This could be used with any client, the synchronous register
+        reads being run by an executor. The clients are not thread safe,
+        so by default the reads are run one at a time, by a single thread,
+        without blocking the event loop.
+
+        :param executor: The executor, or None for a single thread executor.
+                         An executor running reads concurrently must only be
+                         used with a thread safe client.
+    """
+    def __init__(self, executor=None):
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1)
+        self.executor = executor
+
+    async def read(self, register):
+        """
+            Read a register
+
+            :param register: The register to read
+            :return: The value of the register
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, register.read)
+
+class ClientReader:
+    """
+        A reader reading the registers using an asynchronous client
+
+        The client must provide a coroutine read(width, address),
+        as the synchronous clients provide read(width, address).
+
+        :param client: The asynchronous client
+        :param width: The width of the registers, in bits
+    """
+    def __init__(self, client, width=32):
+        self.client = client
+        self.width = width
+
+    async def read(self, register):
+        """
+            Read a register
+
+            :param register: The register to read
+            :return: The value of the register
+        """
+        return await self.client.read(self.width, register.address())
+
+async def read_snapshot(registers, reader=None):
+    """
+        Read registers concurrently
+
+        :param registers: A dictionary of registers, indexed by address
+        :param reader: A reader, or None to use a ThreadedReader
+        :return: A snapshot of the registers
+    """
+    if reader is None:
+        reader = ThreadedReader()
+        try:
+            return await read_snapshot(registers, reader)
+        finally:
+            reader.executor.shutdown(wait=False)
+    addresses = list(registers)
+    values = await asyncio.gather(*[reader.read(registers[address])
+                                    for address in addresses])
+    return Snapshot(zip(addresses, values))
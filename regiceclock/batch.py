@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+    Provide a class to evaluate a clock tree against many register states.
+
+    This uses numpy to evaluate the clock tree for many sets of field
+    values at once, e.g. to process thousands of register dumps.
+    numpy is an optional dependency, only required by this module.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from regiceclock.clock import Divider
+from regiceclock.compiled import KIND_CLOCK, KIND_FIXED, KIND_GATE
+from regiceclock.compiled import KIND_PLL, KIND_MUX, KIND_DIVIDER
+
+__all__ = ['BatchEvaluator']
+
+class BatchEvaluator:
+    """
+        A class to evaluate a clock tree for many sets of field values
+
+        The field values are given as a matrix, with one row per set of
+        values, and one column per field of the compiled tree (in the
+        order of CompiledTree.fields). The results are matrices with one
+        row per set of values, and one column per clock of the compiled
+        tree (in the order of CompiledTree.names).
+
+        Clocks relying on external callbacks (get_freq, get_mux, get_div)
+        or user defined clock classes can't be evaluated that way.
+        They are listed in unsupported, and reported as invalid.
+    """
+    def __init__(self, tree):
+        if numpy is None:
+            raise ImportError("numpy is required to evaluate clocks in batch")
+        self.compiled = tree.compile()
+        self.names = self.compiled.names
+        self.fields = self.compiled.fields
+        self.unsupported = []
+        for pos, clock in enumerate(self.compiled.clocks):
+            if not self._supported(pos, clock):
+                self.unsupported.append(self.names[pos])
+
+    def _supported(self, pos, clock):
+        kind = self.compiled.kinds[pos]
+        if kind == KIND_MUX:
+            return self.compiled.mux_fields[pos] >= 0
+        if kind == KIND_DIVIDER:
+            return not clock.ext_get_div
+        if kind == KIND_PLL:
+            return not clock.ext_get_freq
+        return kind in [KIND_CLOCK, KIND_FIXED, KIND_GATE]
+
+    def values(self, snapshots):
+        """
+            Get the field values from snapshots
+
+            :param snapshots: A list of snapshots
+            :return: A matrix of field values
+        """
+        values = numpy.zeros((len(snapshots), len(self.fields)),
+                             dtype=numpy.int64)
+        for row, snapshot in enumerate(snapshots):
+            for column, field in enumerate(self.fields):
+                values[row, column] = snapshot.read_field(field)
+        return values
+
+    @staticmethod
+    def _lookup(table, keys, default):
+        """
+            Map keys using a dictionary, keys not in the table give default
+        """
+        result = numpy.full(keys.shape, default, dtype=numpy.float64)
+        for key, value in table.items():
+            result[keys == key] = numpy.nan if value is None else value
+        return result
+
+    def _divide(self, pos, clock, values):
+        """
+            Get the divisors, and the rows where the divider gates the clock
+            because its table maps the field value to None
+        """
+        rows = values.shape[0]
+        gate = numpy.zeros(rows, dtype=bool)
+        if clock.div:
+            return numpy.full(rows, clock.div, dtype=numpy.float64), gate
+        field = self.compiled.div_fields[pos]
+        if field < 0:
+            return numpy.full(rows, numpy.nan), gate
+        div = values[:, field]
+        table = self.compiled.div_tables[pos]
+        if table:
+            for key, value in table.items():
+                if value is None:
+                    gate |= div == key
+            return self._lookup(table, div, numpy.nan), gate
+        if clock.div_type == Divider.ONE_BASED:
+            return div.astype(numpy.float64), gate
+        if clock.div_type == Divider.POWER_OF_TWO:
+            return numpy.power(2.0, div), gate
+        return numpy.full(rows, numpy.nan), gate
+
+    def _pll(self, pos, clock, values, parent_freq):
+        fields = self.compiled.pll_fields[pos]
+        if fields is None:
+            return numpy.zeros(values.shape[0])
+        mul, prediv, postdiv, frac, bypass = fields
+        factor = values[:, mul] + clock.mul_offset
+        if frac >= 0:
+            factor = factor + values[:, frac] / (1 << clock.get_frac_bits())
+        div = numpy.ones(values.shape[0], dtype=numpy.int64)
+        if prediv >= 0:
+            div = values[:, prediv] + clock.prediv_offset
+        if postdiv >= 0:
+            div = div * (values[:, postdiv] + clock.postdiv_offset)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            freq = numpy.trunc(parent_freq * factor / div)
+        freq[div == 0] = numpy.nan
+        if bypass >= 0:
+            freq = numpy.where(values[:, bypass] == clock.bypass_val,
+                               parent_freq, freq)
+        return freq
+
+    def evaluate(self, values):
+        """
+            Evaluate the frequency and the state of all the clocks
+
+            :param values: A matrix of field values
+            :return: A tuple with the matrix of frequencies, NaN if the
+                     frequency could not be determined, the matrix of gated
+                     clocks, and the matrix of clocks whose state could not
+                     be determined
+        """
+        values = numpy.asarray(values, dtype=numpy.int64)
+        rows = values.shape[0]
+        count = len(self.names)
+        compiled = self.compiled
+        freqs = numpy.full((rows, count), numpy.nan)
+        gated = numpy.zeros((rows, count), dtype=bool)
+        invalid = numpy.zeros((rows, count), dtype=bool)
+        unsupported = set(self.unsupported)
+        no = numpy.zeros(rows, dtype=bool)
+        yes = numpy.ones(rows, dtype=bool)
+
+        for pos, clock in enumerate(compiled.clocks):
+            if self.names[pos] in unsupported:
+                invalid[:, pos] = True
+                continue
+            kind = compiled.kinds[pos]
+            parent = compiled.parents[pos]
+            gate_parent = compiled.gate_parents[pos]
+
+            if parent >= 0:
+                parent_freq = freqs[:, parent]
+            else:
+                parent_freq = numpy.full(rows, numpy.nan)
+            if kind == KIND_MUX:
+                selector = values[:, compiled.mux_fields[pos]]
+                parents = compiled.mux_parents[pos]
+                # -1 if no clock is selected, -2 for unknown selections
+                selected = self._lookup(parents, selector, -2)
+                selected = selected.astype(numpy.int64)
+                own_invalid = selected == -2
+                own = selected >= 0
+                freq = numpy.where(own_invalid, numpy.nan, 0.0)
+                for parent in set(parents.values()):
+                    if parent >= 0:
+                        freq = numpy.where(selected == parent,
+                                           freqs[:, parent], freq)
+            elif kind == KIND_DIVIDER:
+                div, div_gated = self._divide(pos, clock, values)
+                own_invalid = numpy.isnan(div) & ~div_gated
+                if clock.div_type == Divider.ZERO_TO_GATE:
+                    own = (div != 0) & ~div_gated
+                else:
+                    own = ~div_gated
+                with numpy.errstate(divide='ignore', invalid='ignore'):
+                    freq = numpy.trunc(parent_freq / div)
+                freq[div == 0] = numpy.nan
+                freq[~own] = 0
+                freq[own_invalid] = numpy.nan
+            else:
+                own_invalid = no
+                field = compiled.state_fields[pos]
+                if field >= 0:
+                    own = values[:, field] == compiled.state_vals[pos]
+                else:
+                    own = yes
+                if kind == KIND_FIXED:
+                    freq = numpy.full(rows, clock.freq, dtype=numpy.float64)
+                elif kind == KIND_GATE:
+                    freq = parent_freq
+                elif kind == KIND_PLL:
+                    freq = self._pll(pos, clock, values, parent_freq)
+                else:
+                    freq = numpy.full(rows, numpy.nan)
+
+            if clock.freq_min:
+                freq = numpy.where(freq < clock.freq_min, numpy.nan, freq)
+            if clock.freq_max:
+                freq = numpy.where(clock.freq_max < freq, numpy.nan, freq)
+            freqs[:, pos] = freq
+
+            if gate_parent >= 0:
+                parent_gated = gated[:, gate_parent]
+                parent_invalid = invalid[:, gate_parent]
+            else:
+                parent_gated = no
+                parent_invalid = no
+            invalid[:, pos] = parent_invalid | (~parent_gated & own_invalid)
+            gated[:, pos] = ~invalid[:, pos] & (parent_gated | ~own)
+        return freqs, gated, invalid
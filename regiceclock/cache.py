@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+    Provide a class to cache the registers' value for a limited time.
+
+    Each register is kept for the time to live of its peripheral,
+    so stable configuration registers could be cached longer than
+    the registers updated by the hardware. Volatile registers, e.g.
+    registers holding PLL lock bits, are never cached.
+"""
+
+import time
+
+__all__ = ['FOREVER', 'RegisterCache']
+
+# Time to live of registers that never expire
+FOREVER = float('inf')
+
+class RegisterCache:
+    """
+        A class to cache the value of registers for a limited time
+
+        :param ttl: The time to live of the registers, in seconds,
+                    for peripherals without their own time to live
+        :param timer: A function returning the time, in seconds
+    """
+    def __init__(self, ttl=1, timer=time.monotonic):
+        self.ttl = ttl
+        self.timer = timer
+        self.register_ttls = {}
+        self.volatile = set()
+        self.ttls = {}
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def set_peripheral_ttl(self, peripheral, ttl=None):
+        """
+            Set the time to live of the registers of a peripheral
+
+            :param peripheral: The peripheral
+            :param ttl: The time to live, in seconds, FOREVER to never
+                        expire, or None to use the default one
+        """
+        for register in peripheral.registers.values():
+            if ttl is None:
+                self.register_ttls.pop(register.address(), None)
+            else:
+                self.register_ttls[register.address()] = ttl
+        self.ttls.clear()
+
+    def set_volatile(self, address):
+        """
+            Never cache a register
+
+            :param address: The address of the register
+        """
+        self.volatile.add(address)
+        self.ttls.pop(address, None)
+        self.entries.pop(address, None)
+
+    def get_ttl(self, address):
+        """
+            Get the time to live of a register
+
+            :param address: The address of the register
+            :return: The time to live, in seconds
+        """
+        if address in self.volatile:
+            return 0
+        return self.register_ttls.get(address, self.ttl)
+
+    def read(self, register):
+        """
+            Read a register, from the cache if it has not expired
+
+            :param register: The register to read
+            :return: The value of the register
+        """
+        address = register.address()
+        if address not in self.ttls:
+            self.ttls[address] = self.get_ttl(address)
+        now = self.timer()
+        entry = self.entries.get(address)
+        if entry is not None and now - entry[1] < self.ttls[address]:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        value = register.read()
+        self.entries[address] = (value, now)
+        return value
+
+    def forget(self, address=None):
+        """
+            Drop the cached value of a register
+
+            :param address: The address of the register,
+                            or None to drop all the registers
+        """
+        if address is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(address, None)
@@ -32,9 +32,25 @@
     clock state and so on.
 """
 
+import sys
+import time
 import warnings
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+from types import MappingProxyType
 
 from libregice.device import RegiceObject
+from regiceclock.snapshot import Snapshot, MissingRegister, field_value
+from regiceclock.snapshot import field_bits, field_key
+from regiceclock.stats import TreeStats, NO_STATS
+from regiceclock.aio import read_snapshot
+from regiceclock.cache import RegisterCache
+
+__all__ = ['InvalidDivider', 'InvalidMux', 'InvalidFrequency',
+           'UnknownClock', 'MissingAttribute', 'ClockCycle', 'SealedTree',
+           'MissingAttributes', 'ClockChange', 'EVAL_ERRORS', 'CallbackCache',
+           'ClockTree', 'Clock', 'FixedClock', 'Gate', 'PLL', 'Mux',
+           'Divider']
 
 class InvalidDivider(Exception):
     """
@@ -42,6 +58,12 @@ class InvalidDivider(Exception):
     """
     pass
 
+class InvalidMux(Exception):
+    """
+        An exception raised when the mux selects an unknown input
+    """
+    pass
+
 class InvalidFrequency(Exception):
     """
         An exception raised when the frequency is outside frequency range
@@ -73,6 +95,23 @@ class MissingAttribute(Exception):
         super().__init__("{}: The attribute {} has not been defined"
                          .format(clock, attr))
 
+class ClockCycle(Exception):
+    """
+        An exception raised when a clock is its own ancestor
+    """
+    def __init__(self, clocks):
+        super().__init__("The clocks {} form a cycle"
+                         .format(" -> ".join(clocks)))
+        self.clocks = clocks
+
+class SealedTree(Exception):
+    """
+        An exception raised when modifying a sealed clock tree
+    """
+    def __init__(self, clock):
+        super().__init__("Can't add {}, the clock tree is sealed"
+                         .format(clock))
+
 class MissingAttributes(Exception):
     """
         An exception raised when the clock has not been properly configured
@@ -81,6 +120,102 @@ class MissingAttributes(Exception):
         super().__init__("{}: The attributes {} have not been defined"
                          .format(clock, attrs))
 
+ClockChange = namedtuple('ClockChange', ['name', 'old_freq', 'new_freq',
+                                         'old_enabled', 'new_enabled',
+                                         'timestamp'])
+
+# Immutable tables (mux parents, divider tables), shared between clocks
+TABLES = {}
+
+def freeze_table(table):
+    """
+        Get an immutable copy of a table
+
+        Identical tables share the same copy, e.g. the parents of muxes
+        that could select the same clocks.
+
+        :param table: A dictionary
+        :return: A read-only dictionary
+    """
+    if isinstance(table, MappingProxyType):
+        return table
+    key = frozenset(table.items())
+    if key not in TABLES:
+        TABLES[key] = MappingProxyType(dict(table))
+    return TABLES[key]
+
+# Errors that are collected per clock when evaluating the whole tree
+EVAL_ERRORS = (InvalidFrequency, InvalidDivider, InvalidMux,
+               ZeroDivisionError, MissingRegister, ClockCycle)
+
+def returning(value):
+    """
+        Make a function returning a value, to give a parent's frequency
+    """
+    return lambda: value
+
+def raising(ex):
+    """
+        Make a function raising an exception, to give a parent's frequency
+    """
+    def parent_freq():
+        raise ex
+    return parent_freq
+
+class CallbackCache:
+    """
+        A class to cache the results of an external callback
+
+        The results are indexed by the values of the fields the callback
+        depends on, so the callback is only called when they change.
+        The least recently used results are dropped first.
+
+        The callback reads the device itself, so the results are dropped
+        when a new register epoch starts, and not used when the clocks are
+        evaluated from a snapshot.
+
+        :param fields: The fields the callback depends on
+        :param size: The maximum number of results to keep
+    """
+    __slots__ = ('fields', 'size', 'results', 'epoch', 'hits', 'misses')
+
+    def __init__(self, fields, size=16):
+        self.fields = tuple(fields)
+        self.size = size
+        self.results = OrderedDict()
+        self.epoch = None
+        self.hits = 0
+        self.misses = 0
+
+    def call(self, clock, callback, name):
+        """
+            Get the result of a callback, calling it if not cached
+
+            :param clock: The clock calling the callback
+            :param callback: The callback
+            :param name: The name of the callback, e.g. get_mux
+            :return: The result of the callback
+        """
+        tree = clock.tree
+        if tree.replay is not None:
+            tree._ext_call(name)
+            return callback(clock)
+        if self.epoch != tree.epoch:
+            self.results.clear()
+            self.epoch = tree.epoch
+        key = tuple(clock._read(field) for field in self.fields)
+        if key in self.results:
+            self.hits += 1
+            self.results.move_to_end(key)
+            return self.results[key]
+        self.misses += 1
+        tree._ext_call(name)
+        result = callback(clock)
+        self.results[key] = result
+        if len(self.results) > self.size:
+            self.results.popitem(last=False)
+        return result
+
 class ClockTree:
     """
         A class to represent the clock tree
@@ -93,6 +228,27 @@ class ClockTree:
         self.clocks = {}
         self.tree = {}
         self.peripherals = []
+        self.orphans = {}
+        self.children = {}
+        self.epoch = 0
+        self.memoize = False
+        self.client_write = None
+        self.freqs = {}
+        self.states = {}
+        self.order = None
+        self.unordered = []
+        self.values = None
+        self.replay = None
+        self.compiled = None
+        self.sealed = False
+        self.stats = None
+        self.rates = {}
+        self.field_clocks = None
+        self.register_clocks = None
+        self.register_fields = None
+        self.register_cache = None
+        self.cache_ttls = {}
+        self.volatile = set()
 
     def get(self, name):
         """
@@ -119,7 +275,8 @@ class ClockTree:
         clock = self.get(name)
         if clock is None:
             return 0
-        return clock.get_freq()
+        with self._operation('get_freq'):
+            return clock.get_freq()
 
     def is_gated(self, name):
         """
@@ -135,7 +292,59 @@ class ClockTree:
         clock = self.get(name)
         if clock is None:
             return True
-        return self.get(name).enabled() is False
+        with self._operation('is_gated'):
+            return clock.enabled() is False
+
+    def _rate_index(self, clock):
+        if clock.name not in self.rates:
+            from regiceclock.rate import make_rate_index
+            self.rates[clock.name] = make_rate_index(clock)
+        return self.rates[clock.name]
+
+    def _round_rate(self, name, target):
+        clock = self.get(name)
+        clock.validate()
+        index = self._rate_index(clock)
+        if index is None:
+            return None
+        return index.round(clock, target)
+
+    def round_rate(self, name, target):
+        """
+            Get the rate the closest to a target a clock could be set to
+
+            Only the clock's own setting is considered, e.g. the value of
+            a divider or the input of a mux, not the ones of its ancestors.
+            The rate is the highest one not above the target, or the lowest
+            one if they are all above the target. The rates outside of the
+            clock's frequency range are skipped.
+
+            :param name: The name of the clock
+            :param target: The target rate, in Hz
+            :return: The rate, in Hz. This is the current rate of the clock
+                     if its rate can't be changed.
+        """
+        setting = self._round_rate(name, target)
+        if setting is None:
+            return self.get_freq(name)
+        return setting[1]
+
+    def set_rate(self, name, target):
+        """
+            Set the rate of a clock, as close as possible to a target
+
+            This writes the setting of the clock selected by round_rate().
+            Nothing is written if no setting gives a rate in the clock's
+            frequency range.
+
+            :param name: The name of the clock
+            :param target: The target rate, in Hz
+            :return: The new rate of the clock, in Hz
+        """
+        setting = self._round_rate(name, target)
+        if setting is not None:
+            self.write_field(self.rates[name].field, setting[0])
+        return self.get_freq(name)
 
     def add(self, name, clock):
         """
@@ -144,46 +353,86 @@ class ClockTree:
             :param name: The name of the clock to add
             :param clock: The clock to add
         """
+        if self.sealed:
+            raise SealedTree(name)
+        if name in self.clocks:
+            self._unlink(name, self.clocks[name])
         clock.device = self.device
         self.clocks[name] = clock
+        self._link(name, clock)
+        self.order = None
+        self.compiled = None
+        self.rates.clear()
+        self.field_clocks = None
+        self.invalidate()
+
+    def _link(self, name, clock):
+        parents = self._parents_of(clock)
+        if not parents:
+            self.orphans[name] = None
+        for parent in parents:
+            self.children.setdefault(parent, {})[name] = None
+
+    def _unlink(self, name, clock):
+        self.orphans.pop(name, None)
+        for parent in self._parents_of(clock):
+            self.children.get(parent, {}).pop(name, None)
+
+    @staticmethod
+    def _parents_of(clock):
+        parents = []
+        if clock.parent:
+            parents.append(clock.parent)
+        if hasattr(clock, 'parents') and clock.parents:
+            for parent in clock.parents.values():
+                if parent not in parents:
+                    parents.append(parent)
+        return parents
+
+    def _unknown_parents(self):
+        return [parent for clock in self.clocks.values()
+                for parent in self._parents_of(clock)
+                if parent and parent not in self.clocks]
 
     def get_orphans(self):
         """
             Find all the clocks without parents
 
-            This goes through all the clocks, and find those which don't have
-            a parent. The goal is to find the root clocks, in order make a tree.
+            This uses the index maintained by add() to find the clocks which
+            don't have a parent. The goal is to find the root clocks,
+            in order make a tree.
 
             :return: A list of clocks
         """
-        orphans = {}
-        for clock_name in self.clocks:
-            clock = self.clocks[clock_name]
-            if clock.parent or hasattr(clock, 'parents') and clock.parents:
-                continue
-            orphans[clock_name] = clock
-        return orphans
+        return self._from_index(self.orphans)
 
     def get_children(self, parent):
         """
             Get the clock children
 
-            This goes through the list of clocks to find all the children of
-            the clock. This is used to construct the clock tree.
+            This uses the index maintained by add() to find all the children
+            of the clock, including the muxes which could select it.
+            This is used to construct the clock tree.
 
             :param parent: The name of the clock
             :return: A list of clocks
         """
+        return self._from_index(self.children.get(parent, {}), parent)
+
+    def _from_index(self, names, parent=None):
         clocks = {}
-        for clock_name in self.clocks:
-            clock = self.clocks[clock_name]
-            if clock.parent == parent:
-                clocks[clock_name] = clock
-            if hasattr(clock, 'parents') and parent in clock.parents.values():
+        for clock_name in names:
+            # Clocks may have been removed from self.clocks behind our back,
+            # so only trust the index if it still matches the clock.
+            clock = self.clocks.get(clock_name)
+            if clock is None:
+                continue
+            parents = self._parents_of(clock)
+            if parent in parents or parent is None and not parents:
                 clocks[clock_name] = clock
         return clocks
 
-    def build(self):
+    def build(self, seal=False):
         """
             Build the clock tree
 
@@ -191,6 +440,7 @@ class ClockTree:
             correctly configured. This allows to catch many errors at
             initialization, before to use the clock tree for debugging.
 
+            :param seal: True to seal the tree if all tests passed
             :return: True if all tests passed, False otherwise
         """
         result = True
@@ -199,8 +449,381 @@ class ClockTree:
             if not clock.build():
                 result = False
                 continue
+        for parent in self._unknown_parents():
+            print(UnknownClock(parent))
+            result = False
+        cycle = self.find_cycle()
+        if cycle:
+            print(ClockCycle(cycle))
+            result = False
+        self.index_fields()
+        if result and seal:
+            self.seal()
         return result
 
+    def seal(self):
+        """
+            Seal the clock tree
+
+            This checks all the clocks once, resolves the parents' name
+            to clock objects, and computes the depth and the topological
+            position of each clock. From here, the clocks are not checked
+            anymore when they are used, and no clock could be added to
+            the tree, until unseal() is called.
+        """
+        for clock in self.clocks.values():
+            clock.check()
+        for parent in self._unknown_parents():
+            raise UnknownClock(parent)
+        cycle = self.find_cycle()
+        if cycle:
+            raise ClockCycle(cycle)
+        depths = {}
+        for position, clock_name in enumerate(self.topological_order()):
+            clock = self.clocks[clock_name]
+            clock.seal(position)
+            parents = [depths[parent] for parent in self._parents_of(clock)
+                       if parent in depths]
+            clock.depth = max(parents) + 1 if parents else 0
+            depths[clock_name] = clock.depth
+        self.sealed = True
+
+    def unseal(self):
+        """
+            Unseal the clock tree, to allow modifications again
+        """
+        self.sealed = False
+        for clock in self.clocks.values():
+            clock.unseal()
+        self.invalidate()
+
+    def topological_order(self):
+        """
+            Return the clock names, sorted parents first
+
+            Every parent a clock could have, including all the parents of
+            a mux, comes before the clock. The order is computed once and
+            then kept until a clock is added to, or removed from, the tree.
+
+            :return: A list of clock names
+        """
+        if self.order is not None and len(self.order) == len(self.clocks):
+            return self.order
+        pending = {}
+        for clock_name in self.clocks:
+            parents = self._parents_of(self.clocks[clock_name])
+            pending[clock_name] = len([parent for parent in parents
+                                       if parent in self.clocks])
+        order = [name for name in pending if not pending[name]]
+        for clock_name in order:
+            for child_name in self.get_children(clock_name):
+                pending[child_name] -= 1
+                if not pending[child_name]:
+                    order.append(child_name)
+        # Clocks left behind are in, or depend on, a cycle.
+        # They are evaluated on demand, by the clock itself.
+        self.unordered = [name for name in pending if pending[name] > 0]
+        order += self.unordered
+        self.order = order
+        return order
+
+    def find_cycle(self):
+        """
+            Find a cycle in the clock tree
+
+            All the parents of a mux are considered, so this finds the cycles
+            that exist for any selection of the muxes.
+
+            :return: The list of the clock names forming the cycle,
+                     from the ancestor to the descendant, or None
+        """
+        self.topological_order()
+        if not self.unordered:
+            return None
+        unordered = set(self.unordered)
+        # Each clock left behind has a parent left behind,
+        # so going up from any of them ends in a cycle.
+        path = {}
+        clock_name = self.unordered[0]
+        while clock_name not in path:
+            path[clock_name] = len(path)
+            for parent in self._parents_of(self.clocks[clock_name]):
+                if parent in unordered:
+                    clock_name = parent
+                    break
+        cycle = list(path)[path[clock_name]:] + [clock_name]
+        cycle.reverse()
+        return cycle
+
+    def index_fields(self):
+        """
+            Index the clocks affected by each field and register
+
+            This is done by build(), and when the index is first used
+            after clocks have been added.
+        """
+        order = self.topological_order()
+        position = {name: pos for pos, name in enumerate(order)}
+        readers = {}
+        for clock_name, clock in self.clocks.items():
+            for field in clock.get_fields():
+                readers.setdefault(field_key(field), (field, []))
+                readers[field_key(field)][1].append(clock_name)
+
+        self.field_clocks = {}
+        self.register_clocks = {}
+        self.register_fields = {}
+        registers = {}
+        for key, (field, clocks) in readers.items():
+            affected = self.get_descendants(clocks)
+            registers.setdefault(key[0], set()).update(affected)
+            self.field_clocks[key] = tuple(sorted(affected,
+                                                  key=position.__getitem__))
+            self.register_fields.setdefault(key[0], []).append(
+                (field, tuple(sorted(clocks, key=position.__getitem__))))
+        for address, affected in registers.items():
+            self.register_clocks[address] = tuple(sorted(
+                affected, key=position.__getitem__))
+
+    def _index(self):
+        if self.field_clocks is None:
+            self.index_fields()
+
+    def clocks_affected_by(self, target):
+        """
+            Get the clocks affected by a field or a register
+
+            These are the clocks using the field or a field of the register,
+            and all their possible descendants.
+
+            :param target: A field, a register, or the address of a register
+            :return: A tuple of clock names, in topological order
+        """
+        self._index()
+        if isinstance(target, int):
+            return self.register_clocks.get(target, ())
+        if hasattr(target, 'register'):
+            return self.field_clocks.get(field_key(target), ())
+        return self.register_clocks.get(target.address(), ())
+
+    def _order_of(self, clocks):
+        if clocks is None:
+            return self.topological_order()
+        ancestors = set(self.get_ancestors(clocks))
+        return [name for name in self.topological_order() if name in ancestors]
+
+    def evaluate(self, clocks=None):
+        """
+            Get the frequency of all the clocks in one pass
+
+            This goes through the clocks in topological order, and computes
+            the frequency of each clock from the one of its parent,
+            which has already been computed.
+            Errors are collected per clock instead of being raised.
+            The error of a clock is also the error of its descendants.
+
+            :param clocks: A list of clock names. If set, only evaluate those
+                           clocks and their ancestors.
+            :return: A tuple with a dictionary of clock frequencies,
+                     and a dictionary of errors, both indexed by clock name
+        """
+        freqs = {}
+        errors = {}
+        with self.single_read():
+            for clock_name in self._order_of(clocks):
+                clock = self.clocks[clock_name]
+                try:
+                    freqs[clock_name] = self._evaluate(clock, freqs, errors)
+                except EVAL_ERRORS as ex:
+                    errors[clock_name] = ex
+        if self.memoize:
+            self.freqs.update(freqs)
+        return freqs, errors
+
+    def _evaluate(self, clock, freqs, errors):
+        def parent_freq():
+            parent = clock.get_parent()
+            if parent is None:
+                return None
+            if parent.name in errors:
+                raise errors[parent.name]
+            if parent.name in freqs:
+                return freqs[parent.name]
+            return parent.get_freq()
+
+        clock.validate()
+        return clock.check_freq(clock._compute_freq(parent_freq))
+
+    def get_all_freqs(self):
+        """
+            Get the frequency of all the clocks in one pass
+
+            Same as evaluate(), but only return the frequencies.
+            The clocks whose frequency could not be determined are missing.
+
+            :return: A dictionary of clock frequencies, indexed by clock name
+        """
+        return self.evaluate()[0]
+
+    def evaluate_gating(self, clocks=None):
+        """
+            Get the state of all the clocks in one pass
+
+            This goes through the clocks in topological order, and propagates
+            the state of each clock to its children. Each field is read once.
+            Errors are collected per clock instead of being raised.
+            The error of a clock is also the error of its descendants.
+
+            :param clocks: A list of clock names. If set, only evaluate those
+                           clocks and their ancestors.
+            :return: A tuple with a dictionary of gated clocks,
+                     and a dictionary of errors, both indexed by clock name.
+                     For each gated clock, the dictionary gives the name of
+                     its first gated ancestor, or its own name if the clock
+                     is gated because it is disabled.
+        """
+        gated = {}
+        errors = {}
+        with self.single_read():
+            for clock_name in self._order_of(clocks):
+                clock = self.clocks[clock_name]
+                try:
+                    clock.validate()
+                    if clock.parent and clock.parent in errors:
+                        raise errors[clock.parent]
+                    if clock.parent and clock.parent in gated:
+                        gated[clock_name] = gated[clock.parent]
+                    elif not clock._enabled():
+                        gated[clock_name] = clock_name
+                except EVAL_ERRORS as ex:
+                    errors[clock_name] = ex
+        if self.memoize:
+            for clock_name in self._order_of(clocks):
+                if clock_name not in errors:
+                    self.states[clock_name] = clock_name not in gated
+        return gated, errors
+
+    def get_all_gating(self):
+        """
+            Get the state of all the clocks in one pass
+
+            Same as evaluate_gating(), but only return the gated clocks.
+
+            :return: A dictionary giving, for each gated clock,
+                     the name of its first gated ancestor
+        """
+        return self.evaluate_gating()[0]
+
+    def compile(self, recompile=False):
+        """
+            Compile the clock tree
+
+            This creates a flat representation of the clock tree, which is
+            much faster to evaluate than the clock objects. The compiled tree
+            is kept until a clock is added to the tree. It must be compiled
+            again, using recompile=True, if clocks are modified.
+
+            :param recompile: True to compile the tree again
+            :return: A CompiledTree
+        """
+        if self.compiled is None or recompile or \
+           len(self.compiled.names) != len(self.clocks):
+            from regiceclock.compiled import CompiledTree
+            self.compiled = CompiledTree(self)
+        return self.compiled
+
+    def memory_report(self):
+        """
+            Get the memory used by the clocks
+
+            The size of the tables shared by the clocks (mux parents and
+            divider tables) is reported once, in 'tables'.
+
+            :return: A dictionary giving the number of objects and their size
+                     in bytes, indexed by clock class name
+        """
+        report = {}
+        tables = {}
+        for clock in self.clocks.values():
+            kind = report.setdefault(type(clock).__name__,
+                                     {'count': 0, 'bytes': 0})
+            kind['count'] += 1
+            kind['bytes'] += sys.getsizeof(clock)
+            if hasattr(clock, '__dict__'):
+                kind['bytes'] += sys.getsizeof(clock.__dict__)
+            for table in clock.get_tables():
+                tables[id(table)] = table
+        report['tables'] = {'count': len(tables), 'bytes': 0}
+        for table in tables.values():
+            # Measure the dictionary behind the read-only proxy
+            report['tables']['bytes'] += sys.getsizeof(dict(table))
+        return report
+
+    def walk(self):
+        """
+            Go through the clock tree, depth first
+
+            This yields the clocks in the same order as make_tree(), e.g. a
+            mux is only yielded under its selected parent, or once with an
+            unknown frequency and state if its field can't be read. The
+            frequency and the state of each clock are computed once, from its
+            parent's ones, so the clock tree never has to be kept in memory.
+
+            :return: An iterator of (depth, name, clock, freq, enabled) tuples.
+                     freq and enabled are None if they could not be determined.
+        """
+        stack = [(0, name, clock, None, returning(None), True)
+                 for name, clock in self.get_orphans().items()]
+        stack.reverse()
+        unplaced = set()
+        while stack:
+            depth, name, clock, parent, parent_freq, enabled = stack.pop()
+            error = None
+            if isinstance(clock, Mux):
+                try:
+                    selected = clock.get_parent()
+                except EVAL_ERRORS as ex:
+                    error = ex
+                if error is not None:
+                    # The selected parent is unknown: yield the mux once,
+                    # under the first of its parents.
+                    if name in unplaced:
+                        continue
+                    unplaced.add(name)
+                elif parent is None or selected is not parent:
+                    continue
+
+            if error is not None:
+                freq = None
+                enabled = None
+                parent_freq = raising(error)
+            else:
+                try:
+                    freq = clock.check_freq(clock._compute_freq(parent_freq))
+                    parent_freq = returning(freq)
+                except EVAL_ERRORS as ex:
+                    freq = None
+                    parent_freq = raising(ex)
+                try:
+                    if isinstance(clock, Mux):
+                        # A mux is enabled when a parent is selected,
+                        # which is the one it's walked under
+                        enabled = True
+                    elif not clock.parent:
+                        enabled = clock._enabled()
+                    elif enabled is not None:
+                        enabled = clock._enabled() & enabled
+                except EVAL_ERRORS:
+                    enabled = None
+            yield depth, name, clock, freq, enabled
+
+            children = [(depth + 1, child_name, child, clock, parent_freq,
+                         enabled)
+                        for child_name, child in
+                        self.get_children(name).items()]
+            children.reverse()
+            stack += children
+
     def make_tree(self, parent=None, clocks=None):
         """
             Make and return the clock tree
@@ -213,15 +836,19 @@ class ClockTree:
             :return: a tree of clocks
         """
         if parent is None and clocks is None:
-            orphans = self.get_orphans()
-            self.tree = self.make_tree(None, orphans)
+            with self._operation('make_tree'):
+                orphans = self.get_orphans()
+                self.tree = self.make_tree(None, orphans)
             tree = self.tree
         else:
             tree = {}
             for clock_name in clocks:
                 clock = clocks[clock_name]
                 if isinstance(clock, Mux):
-                    mux_parent = clock.get_parent()
+                    if self.stats is None:
+                        mux_parent = clock.get_parent()
+                    else:
+                        mux_parent = self.stats.call(clock, clock.get_parent)
                     if mux_parent:
                         if not mux_parent == parent:
                             continue
@@ -245,13 +872,89 @@ class ClockTree:
         """
         self.peripherals.append(peripheral)
 
-    def prefetch(self):
+    def get_ancestors(self, clocks):
+        """
+            Get the clocks and all their possible ancestors
+
+            All the parents of a mux are considered, not only the selected one.
+
+            :param clocks: A list of clock names
+            :return: A list of clock names
+        """
+        ancestors = {}
+        pending = list(clocks)
+        while pending:
+            clock_name = pending.pop()
+            if clock_name in ancestors:
+                continue
+            clock = self.get(clock_name)
+            ancestors[clock_name] = None
+            for parent in self._parents_of(clock):
+                if parent and parent not in ancestors:
+                    pending.append(parent)
+        return list(ancestors)
+
+    def get_descendants(self, clocks):
+        """
+            Get the clocks and all their possible descendants
+
+            All the children of a clock are considered, including the muxes
+            that could select it.
+
+            :param clocks: A list of clock names
+            :return: A list of clock names
+        """
+        descendants = {}
+        pending = list(clocks)
+        while pending:
+            clock_name = pending.pop()
+            if clock_name in descendants:
+                continue
+            descendants[clock_name] = None
+            for child_name in self.get_children(clock_name):
+                if child_name not in descendants:
+                    pending.append(child_name)
+        return list(descendants)
+
+    def get_registers(self, clocks=None):
+        """
+            Get the registers used by clocks
+
+            This gets the registers of the fields used by the clocks and
+            all their possible ancestors, which are the registers to read
+            to evaluate the clocks.
+
+            :param clocks: A list of clock names, or None for all the clocks
+            :return: A dictionary of registers, indexed by address
+        """
+        if clocks is None:
+            clocks = self.clocks
+        else:
+            clocks = self.get_ancestors(clocks)
+        registers = {}
+        for clock_name in clocks:
+            for field in self.clocks[clock_name].get_fields():
+                register = field.register
+                registers.setdefault(register.address(), register)
+        return registers
+
+    def prefetch(self, clocks=None):
         """
             Prefetch the content of peripherals' registers
+
+            :param clocks: A list of clock names. If set, only prefetch the
+                           registers required to evaluate those clocks,
+                           instead of all the peripherals' registers.
         """
-        self._test_peripherals()
-        for peripheral in self.peripherals:
-            peripheral.cache_prefetch()
+        with self._operation('prefetch'):
+            if clocks is None:
+                self._test_peripherals()
+                for peripheral in self.peripherals:
+                    peripheral.cache_prefetch()
+            else:
+                for register in self.get_registers(clocks).values():
+                    register.cache_prefetch()
+        self.invalidate()
 
     def cache_enable(self):
         """
@@ -273,11 +976,484 @@ class ClockTree:
         self._test_peripherals()
         for peripheral in self.peripherals:
             peripheral.cache_configure(RegiceObject.DISABLED)
+        self.invalidate()
+
+    def cache_ttl_enable(self, ttl=1, timer=time.monotonic):
+        """
+            Enable a read cache whose registers expire
+
+            From here, the fields are read from registers cached for at
+            most ttl seconds, or for the time to live of their peripheral.
+            Volatile registers are always read from the device.
+
+            The times to live and the volatile registers set before are
+            kept, and apply to the new cache.
+
+            :param ttl: The default time to live of registers, in seconds
+            :param timer: A function returning the time, in seconds
+        """
+        self.register_cache = RegisterCache(ttl, timer)
+        for peripheral, peripheral_ttl in self.cache_ttls.values():
+            self.register_cache.set_peripheral_ttl(peripheral, peripheral_ttl)
+        for address in self.volatile:
+            self.register_cache.set_volatile(address)
+        self.invalidate()
+
+    def cache_ttl_disable(self):
+        """
+            Disable the read cache whose registers expire
+        """
+        self.register_cache = None
+        self.invalidate()
+
+    def set_cache_ttl(self, peripheral, ttl):
+        """
+            Set the time to live of the registers of a peripheral
+
+            This is kept until changed, even if the cache is disabled.
+
+            :param peripheral: The peripheral
+            :param ttl: The time to live, in seconds, FOREVER to never
+                        expire, or None to use the default one
+        """
+        if ttl is None:
+            self.cache_ttls.pop(peripheral.address(), None)
+        else:
+            self.cache_ttls[peripheral.address()] = (peripheral, ttl)
+        if self.register_cache is not None:
+            self.register_cache.set_peripheral_ttl(peripheral, ttl)
+
+    def set_volatile(self, target):
+        """
+            Always read a register from the device
+
+            This is kept even if the cache is disabled.
+
+            :param target: A register, or a field of the register
+        """
+        if hasattr(target, 'register'):
+            target = target.register
+        self.volatile.add(target.address())
+        if self.register_cache is not None:
+            self.register_cache.set_volatile(target.address())
+
+    def memoize_enable(self):
+        """
+            Enable memoization of clocks' frequency and state
+
+            From here, the frequency and the state of each clock are only
+            computed once per register epoch. The epoch changes on prefetch(),
+            cache_disable(), invalidate(), and on any write of a register
+            used by the clocks, e.g. through Field.write(), as the writes of
+            the device's client are watched.
+
+            The registers changed by the device itself are not seen, so the
+            memoized values stay stale until invalidate() is called.
+        """
+        self.memoize = True
+        if self.client_write is None:
+            client = self.device.client
+            self.client_write = client.write
+            client.write = self._client_write
+        self.invalidate()
+
+    def memoize_disable(self):
+        """
+            Disable memoization of clocks' frequency and state
+        """
+        self.memoize = False
+        if self.client_write is not None:
+            self.device.client.write = self.client_write
+            self.client_write = None
+        self.invalidate()
+
+    def _client_write(self, width, address, value):
+        self.client_write(width, address, value)
+        self._index()
+        if address in self.register_clocks:
+            self.invalidate()
+
+    def stats_enable(self):
+        """
+            Enable the recording of statistics
+
+            From here, the field reads, the external callbacks invocations
+            and the time spent per clock kind are recorded for each call of
+            get_freq(), is_gated(), make_tree() and prefetch().
+
+            :return: The TreeStats recording the statistics
+        """
+        self.stats = TreeStats()
+        return self.stats
+
+    def stats_disable(self):
+        """
+            Disable the recording of statistics
+        """
+        self.stats = None
+
+    @contextmanager
+    def profile(self):
+        """
+            A context in which the statistics are recorded
+
+            The statistics recorded in the context are returned by the
+            context manager, and are not added to the tree's ones.
+        """
+        stats = self.stats
+        self.stats = TreeStats()
+        try:
+            yield self.stats
+        finally:
+            self.stats = stats
+
+    def _operation(self, name):
+        if self.stats is None:
+            return NO_STATS
+        return self.stats.operation(name)
+
+    def _ext_call(self, callback):
+        if self.stats is not None:
+            self.stats.ext_call(callback)
+
+    def invalidate(self):
+        """
+            Start a new register epoch
+
+            This drops all the memoized frequencies and states,
+            and the registers cached by cache_ttl_enable().
+            This must be called if registers have been modified
+            without using write_field().
+        """
+        self.epoch += 1
+        self.freqs.clear()
+        self.states.clear()
+        if self.register_cache is not None:
+            self.register_cache.forget()
+
+    def write_field(self, field, value):
+        """
+            Write a field and start a new register epoch
+
+            :param field: The field to write
+            :param value: The value to write
+        """
+        field.write(value)
+        self.invalidate()
+
+    def write_fields(self, fields):
+        """
+            Write many fields and start a new register epoch
+
+            The fields of a register are written at once, so each register
+            is only read and written once. Registers already holding the
+            values are not written.
+
+            :param fields: A list of (field, value) tuples
+        """
+        registers = {}
+        for field, value in fields:
+            register = field.register
+            offset, width = field_bits(field)
+            mask = ((1 << width) - 1) << offset
+            _, reg_mask, reg_value = registers.get(register.address(),
+                                                   (register, 0, 0))
+            registers[register.address()] = (register, reg_mask | mask,
+                                             (reg_value & ~mask) |
+                                             ((value << offset) & mask))
+        for register, mask, value in registers.values():
+            current = register.read()
+            if (current & ~mask) | value != current:
+                register.write((current & ~mask) | value)
+        self.invalidate()
+
+    def _chain(self, name):
+        """
+            Get a clock and its current ancestors, from the clock to the root
+        """
+        chain = []
+        names = {}
+        clock = self.get(name)
+        while clock is not None:
+            if clock.name in names:
+                cycle = [chain_clock.name
+                         for chain_clock in chain[names[clock.name]:]]
+                cycle.reverse()
+                raise ClockCycle([clock.name] + cycle)
+            names[clock.name] = len(chain)
+            chain.append(clock)
+            clock = clock.get_parent()
+        return chain
+
+    def enable(self, *names):
+        """
+            Enable clocks and all their ancestors
+
+            The enable fields of the clocks and of their currently selected
+            ancestors are written at once, using write_fields().
+
+            :param names: The names of the clocks to enable
+        """
+        fields = {}
+        for name in names:
+            for clock in self._chain(name):
+                if clock.en_field is not None:
+                    fields[id(clock.en_field)] = (clock.en_field, clock.en_val)
+        self.write_fields(fields.values())
+
+    def disable(self, *names):
+        """
+            Disable clocks
+
+            Only the enable fields of the clocks are written, at once,
+            using write_fields(). Their ancestors are left enabled,
+            as they could be used by other clocks.
+
+            :param names: The names of the clocks to disable
+        """
+        fields = []
+        for name in names:
+            clock = self.get(name)
+            clock.validate()
+            if clock.en_field is not None:
+                fields.append((clock.en_field, 0 if clock.en_val else 1))
+        self.write_fields(fields)
+
+    def read_field(self, field):
+        """
+            Read a field
+
+            Inside single_read(), a field is only read once from the device.
+            After cache_ttl_enable(), the registers are read from the cache
+            until they expire.
+
+            :param field: The field to read
+            :return: The value of the field
+        """
+        if self.stats is not None:
+            self.stats.read()
+        if self.replay is not None:
+            return self.replay.read_field(field)
+        if self.values is None:
+            return self._read_device(field)
+        # Fields are not hashable, so use their id. Keep a reference on
+        # the field to make sure the id is not reused during the pass.
+        key = id(field)
+        if key not in self.values:
+            self.values[key] = (field, self._read_device(field))
+        return self.values[key][1]
+
+    def _read_device(self, field):
+        if self.register_cache is None:
+            return int(field)
+        return field_value(field, self.register_cache.read(field.register))
+
+    def snapshot(self, clocks=None):
+        """
+            Save the registers used by the clocks
+
+            :param clocks: A list of clock names. If set, only save the
+                           registers required to evaluate those clocks.
+            :return: A snapshot of the registers
+        """
+        registers = {}
+        for address, register in self.get_registers(clocks).items():
+            registers[address] = register.read()
+        return Snapshot(registers)
+
+    async def asnapshot(self, clocks=None, reader=None):
+        """
+            Same as snapshot(), reading the registers concurrently
+
+            :param clocks: A list of clock names. If set, only save the
+                           registers required to evaluate those clocks.
+            :param reader: A reader, such as ThreadedReader or ClientReader,
+                           or None to use a ThreadedReader
+            :return: A snapshot of the registers
+        """
+        return await read_snapshot(self.get_registers(clocks), reader)
+
+    async def aget_freq(self, name, reader=None):
+        """
+            Same as get_freq(), without blocking on the register reads
+
+            The registers that may be used by the clock are read
+            concurrently, and the clock is evaluated from them.
+            Note that external callbacks (get_freq, get_mux, get_div)
+            may still access the device.
+
+            :param name: The name of the clock to get the frequency
+            :param reader: A reader, or None to use a ThreadedReader
+            :return: The clock frequency, or 0 if the clock name is None
+        """
+        if self.get(name) is None:
+            return 0
+        snapshot = await self.asnapshot([name], reader)
+        with self.use_snapshot(snapshot):
+            return self.get_freq(name)
+
+    async def aevaluate(self, clocks=None, reader=None):
+        """
+            Same as evaluate(), without blocking on the register reads
+
+            :param clocks: A list of clock names, or None for all the clocks
+            :param reader: A reader, or None to use a ThreadedReader
+            :return: A tuple with a dictionary of clock frequencies,
+                     and a dictionary of errors, both indexed by clock name
+        """
+        snapshot = await self.asnapshot(clocks, reader)
+        with self.use_snapshot(snapshot):
+            return self.evaluate(clocks)
+
+    def get_changed_clocks(self, old, new):
+        """
+            Get the clocks using a field that differs between two snapshots
+
+            :param old: A snapshot
+            :param new: Another snapshot
+            :return: A list of clock names
+        """
+        clocks = {}
+        for field, readers in self._changed_fields(old, new):
+            clocks.update(dict.fromkeys(readers))
+        return self._order_of_index(clocks)
+
+    def _changed_fields(self, old, new):
+        """
+            Get the fields that differ between two snapshots
+
+            :return: An iterator of (field, clock names) tuples
+        """
+        self._index()
+        for address in set(old) | set(new):
+            if address in old and address in new and \
+               old[address] == new[address]:
+                continue
+            for field, readers in self.register_fields.get(address, []):
+                if address not in old or address not in new or \
+                   field_value(field, old[address]) != \
+                   field_value(field, new[address]):
+                    yield field, readers
+
+    def _order_of_index(self, clocks):
+        return [name for name in self.topological_order() if name in clocks]
+
+    def _evaluate_snapshot(self, snapshot, clocks):
+        with self.use_snapshot(snapshot):
+            freqs, _ = self.evaluate(clocks)
+            gated, errors = self.evaluate_gating(clocks)
+        states = {}
+        for clock_name in clocks:
+            if clock_name not in errors:
+                states[clock_name] = clock_name not in gated
+        return freqs, states
+
+    def diff(self, old, new=None):
+        """
+            Get the clocks whose frequency or state differs between snapshots
+
+            This finds the fields that changed between the snapshots,
+            and only evaluates the clocks using them and their descendants.
+
+            :param old: A snapshot
+            :param new: Another snapshot, or None to use the current state
+            :return: A list of ClockChange, in topological order. The frequency
+                     or the state is None if it could not be determined.
+        """
+        if new is None:
+            new = self.snapshot()
+        changed = set()
+        for field, _ in self._changed_fields(old, new):
+            changed.update(self.clocks_affected_by(field))
+        if not changed:
+            return []
+        old_freqs, old_states = self._evaluate_snapshot(old, changed)
+        new_freqs, new_states = self._evaluate_snapshot(new, changed)
+        changes = []
+        for clock_name in self._order_of(changed):
+            if clock_name not in changed:
+                continue
+            change = ClockChange(clock_name,
+                                 old_freqs.get(clock_name),
+                                 new_freqs.get(clock_name),
+                                 old_states.get(clock_name),
+                                 new_states.get(clock_name),
+                                 new.timestamp)
+            if change.old_freq != change.new_freq or \
+               change.old_enabled != change.new_enabled:
+                changes.append(change)
+        return changes
+
+    def watch(self, interval=1, count=None, snapshot=None):
+        """
+            Poll the registers and yield the clock changes
+
+            This periodically reads the registers used by the clocks.
+            The clocks are only evaluated if a register has changed,
+            and only the clocks affected by the change are evaluated.
+
+            :param interval: The time between two polls, in seconds
+            :param count: The number of polls, or None to poll forever
+            :param snapshot: The initial state, or None to use the current one
+            :return: An iterator of ClockChange
+        """
+        previous = snapshot
+        if previous is None:
+            previous = self.snapshot()
+        polls = 0
+        while count is None or polls < count:
+            time.sleep(interval)
+            current = self.snapshot()
+            polls += 1
+            if current == previous:
+                continue
+            for change in self.diff(previous, current):
+                yield change
+            previous = current
+
+    @contextmanager
+    def use_snapshot(self, snapshot):
+        """
+            A context in which fields are read from a snapshot
+
+            This allows to evaluate the clock tree without device,
+            e.g. to analyse the state of a board saved earlier.
+            Note that external callbacks (get_freq, get_mux, get_div)
+            may still access the device.
+
+            :param snapshot: The snapshot to read the fields from
+        """
+        replay = self.replay
+        self.replay = snapshot
+        self.invalidate()
+        try:
+            yield
+        finally:
+            self.replay = replay
+            self.invalidate()
+
+    @contextmanager
+    def single_read(self):
+        """
+            A context in which each field is read only once
+        """
+        if self.values is not None:
+            yield
+            return
+        self.values = {}
+        try:
+            yield
+        finally:
+            self.values = None
 
 class Clock:
     """
         A class to represent a clock
     """
+    __slots__ = ('parent', 'name', 'tree', 'device', 'en_field', 'en_val',
+                 'rdy_field', 'rdy_val', 'freq_min', 'freq_max',
+                 'parent_clock', 'depth', 'position', 'ext_cache')
+
     def __init__(self, **kwargs):
         self.parent = kwargs.get('parent', None)
         self.name = kwargs.get('name', None)
@@ -289,11 +1465,32 @@ class Clock:
         self.rdy_val = kwargs.get('rdy_val', 1)
         self.freq_min = kwargs.get('min', None)
         self.freq_max = kwargs.get('max', None)
+        self.parent_clock = None
+        self.depth = None
+        self.position = None
+        # The fields the external callback depends on, to cache its results
+        self.ext_cache = None
+        if kwargs.get('depends_on'):
+            self.ext_cache = CallbackCache(kwargs['depends_on'],
+                                           kwargs.get('cache_size', 16))
 
         if self.tree and self.name:
             self.tree.add(self.name, self)
 
+    def _read(self, field):
+        if self.tree is None:
+            return int(field)
+        return self.tree.read_field(field)
+
+    def _call_ext(self, callback, name):
+        if self.ext_cache is None:
+            self.tree._ext_call(name)
+            return callback(self)
+        return self.ext_cache.call(self, callback, name)
+
     def _get_parent(self):
+        if self.tree.sealed:
+            return self.parent_clock
         return self.tree.get(self.parent)
 
     def get_parent(self):
@@ -306,35 +1503,122 @@ class Clock:
 
             :return: The clock's parent
         """
-        self.check()
+        self.validate()
         return self._get_parent()
 
-    def _get_freq(self):
+    def _parent_freq(self):
+        parent = self.get_parent()
+        if parent is None:
+            return None
+        return parent.get_freq()
+
+    def _freq(self, parent_freq):
+        """
+            Compute the clock frequency
+
+            :param parent_freq: A function returning the parent's frequency,
+                                or None if the clock has no parent
+            :return: The clock frequency, in Hz
+        """
         raise InvalidFrequency(self)
 
-    def get_freq(self):
+    def _get_freq(self):
+        return self._freq(self._parent_freq)
+
+    def _compute_freq(self, parent_freq):
         """
-            Return the clock freq
+            Compute the clock frequency from its parent's one
 
-            Each clock provide a method _get_freq() that calculates
-            and returns the current frequency of the clock, based one
-            parent's one.
+            A subclass may override _get_freq() instead of _freq(), in which
+            case _get_freq() is called and gets the parent's frequency itself.
 
+            :param parent_freq: A function returning the parent's frequency
             :return: The clock frequency, in Hz
         """
-        self.check()
-        freq = self._get_freq()
+        if type(self)._get_freq is not Clock._get_freq:
+            return self._get_freq()
+        return self._freq(parent_freq)
+
+    def check_freq(self, freq):
+        """
+            Raise an exception if the frequency is outside frequency range
+
+            :param freq: The frequency to check
+            :return: The frequency
+        """
         if self.freq_min and freq < self.freq_min:
             raise InvalidFrequency(self, freq=freq)
         if self.freq_max and self.freq_max < freq:
             raise InvalidFrequency(self, freq=freq)
         return freq
 
+    def get_freq(self):
+        """
+            Return the clock freq
+
+            Each clock provide a method _get_freq() that calculates
+            and returns the current frequency of the clock, based one
+            parent's one.
+
+            :return: The clock frequency, in Hz
+        """
+        self.validate()
+        tree = self.tree
+        stats = tree.stats
+        if tree.memoize and self.name in tree.freqs:
+            return tree.freqs[self.name]
+
+        # Go up through the selected parents, and then compute the
+        # frequencies from the top, so the stack doesn't grow with depth.
+        # The errors are only raised if a clock uses its parent's frequency,
+        # as if each clock called the get_freq() of its parent.
+        chain = []
+        names = {}
+        clock = self
+        parent_freq = returning(None)
+        while clock is not None:
+            if clock.name in names:
+                cycle = [chain_clock.name
+                         for chain_clock in chain[names[clock.name]:]]
+                cycle.reverse()
+                parent_freq = raising(ClockCycle([clock.name] + cycle))
+                break
+            names[clock.name] = len(chain)
+            chain.append(clock)
+            try:
+                if stats is None:
+                    parent = clock.get_parent()
+                else:
+                    parent = stats.call(clock, clock.get_parent)
+            except Exception as ex:
+                parent_freq = raising(ex)
+                break
+            if parent is not None and tree.memoize and \
+               parent.name in tree.freqs:
+                parent_freq = returning(tree.freqs[parent.name])
+                break
+            clock = parent
+
+        for clock in reversed(chain):
+            try:
+                clock.validate()
+                if stats is None:
+                    freq = clock._compute_freq(parent_freq)
+                else:
+                    freq = stats.call(clock, clock._compute_freq, parent_freq)
+                freq = clock.check_freq(freq)
+                if tree.memoize:
+                    tree.freqs[clock.name] = freq
+                parent_freq = returning(freq)
+            except Exception as ex:
+                parent_freq = raising(ex)
+        return parent_freq()
+
     def _enabled(self):
         if self.rdy_field:
-            return self.rdy_field == self.rdy_val
+            return self._read(self.rdy_field) == self.rdy_val
         if self.en_field:
-            return self.en_field == self.en_val
+            return self._read(self.en_field) == self.en_val
         return True
 
     def enabled(self):
@@ -347,11 +1631,65 @@ class Clock:
 
             :return: True if the clock and its ancestors are enabled
         """
-        self.check()
-        parent_enabled = True
-        if self.parent:
-            parent_enabled = self.get_parent().enabled()
-        return self._enabled() & parent_enabled
+        self.validate()
+        tree = self.tree
+        stats = tree.stats
+        if tree.memoize and self.name in tree.states:
+            return tree.states[self.name]
+
+        # Go up through the parents, and then compute the states from the top
+        chain = []
+        names = {}
+        clock = self
+        enabled = True
+        while True:
+            if clock.name in names:
+                cycle = [chain_clock.name
+                         for chain_clock in chain[names[clock.name]:]]
+                cycle.reverse()
+                raise ClockCycle([clock.name] + cycle)
+            names[clock.name] = len(chain)
+            chain.append(clock)
+            if not clock.parent:
+                break
+            if stats is None:
+                parent = clock.get_parent()
+            else:
+                parent = stats.call(clock, clock.get_parent)
+            if tree.memoize and parent.name in tree.states:
+                enabled = tree.states[parent.name]
+                break
+            clock = parent
+
+        for clock in reversed(chain):
+            clock.validate()
+            if stats is None:
+                enabled = clock._enabled() & enabled
+            else:
+                enabled = stats.call(clock, clock._enabled) & enabled
+            if tree.memoize:
+                tree.states[clock.name] = enabled
+        return enabled
+
+    def get_fields(self):
+        """
+            Get the fields used by the clock
+
+            :return: A list of fields
+        """
+        fields = [field for field in (self.en_field, self.rdy_field)
+                  if field is not None]
+        if self.ext_cache is not None:
+            fields += self.ext_cache.fields
+        return fields
+
+    def get_tables(self):
+        """
+            Get the tables used by the clock
+
+            :return: A list of read-only dictionaries
+        """
+        return []
 
     def _check(self):
         pass
@@ -370,6 +1708,32 @@ class Clock:
             raise MissingAttribute(self.tree, 'tree')
         self._check()
 
+    def validate(self):
+        """
+            Same as check(), but do nothing if the clock tree is sealed
+        """
+        if self.tree is None or not self.tree.sealed:
+            self.check()
+
+    def seal(self, position):
+        """
+            Resolve the parent, and save the topological position
+
+            This is called by ClockTree.seal().
+
+            :param position: The position of the clock in topological order
+        """
+        self.parent_clock = self.tree.get(self.parent)
+        self.position = position
+
+    def unseal(self):
+        """
+            Forget everything computed by seal()
+        """
+        self.parent_clock = None
+        self.depth = None
+        self.position = None
+
     def build(self):
         """
             Same as check(), but return False if something is wrong.
@@ -388,6 +1752,8 @@ class FixedClock(Clock):
     """
         A class that represents a fixed clock
     """
+    __slots__ = ('freq',)
+
     def __init__(self, **kwargs):
         super(FixedClock, self).__init__(**kwargs)
         self.freq = kwargs.get('freq', None)
@@ -396,51 +1762,139 @@ class FixedClock(Clock):
         if self.freq is None:
             raise MissingAttribute(self.name, 'freq')
 
-    def _get_freq(self):
+    def _freq(self, parent_freq):
         return self.freq
 
 class Gate(Clock):
     """
         A class that represents a clock gate
     """
+    __slots__ = ()
+
     def _check(self):
         if not self.en_field:
             raise MissingAttribute(self.name, 'en_field')
 
     def _enabled(self):
         if self.rdy_field:
-            return self.rdy_field == self.rdy_val
-        return self.en_field == self.en_val
+            return self._read(self.rdy_field) == self.rdy_val
+        return self._read(self.en_field) == self.en_val
 
-    def _get_freq(self):
-        return self.get_parent().get_freq()
+    def _freq(self, parent_freq):
+        return parent_freq()
 
 class PLL(Clock):
     """
         A class that represents a PLL clock
+
+        The frequency is given by the get_freq callback, or computed from
+        the parent's frequency and the PLL's fields:
+        parent * (mul + frac / 2 ** frac_bits) / (prediv * postdiv).
+        Each field value is added to its offset (e.g. 1 for fields holding
+        the value minus one). The pre and post dividers are optional.
+        If the bypass field is set to bypass_val, the PLL outputs its
+        parent's frequency. The lock field, if any, is used as ready field.
     """
+    __slots__ = ('ext_get_freq', 'mul_field', 'mul_offset', 'prediv_field',
+                 'prediv_offset', 'postdiv_field', 'postdiv_offset',
+                 'frac_field', 'frac_bits', 'bypass_field', 'bypass_val')
+
     def __init__(self, **kwargs):
+        if 'lock_field' in kwargs:
+            kwargs.setdefault('rdy_field', kwargs['lock_field'])
+            kwargs.setdefault('rdy_val', kwargs.get('lock_val', 1))
         super(PLL, self).__init__(**kwargs)
         self.ext_get_freq = kwargs.get('get_freq', None)
+        self.mul_field = kwargs.get('mul_field', None)
+        self.mul_offset = kwargs.get('mul_offset', 0)
+        self.prediv_field = kwargs.get('prediv_field', None)
+        self.prediv_offset = kwargs.get('prediv_offset', 0)
+        self.postdiv_field = kwargs.get('postdiv_field', None)
+        self.postdiv_offset = kwargs.get('postdiv_offset', 0)
+        self.frac_field = kwargs.get('frac_field', None)
+        self.frac_bits = kwargs.get('frac_bits', None)
+        self.bypass_field = kwargs.get('bypass_field', None)
+        self.bypass_val = kwargs.get('bypass_val', 1)
+
+    def get_fields(self):
+        fields = super(PLL, self).get_fields()
+        for field in (self.mul_field, self.prediv_field, self.postdiv_field,
+                      self.frac_field, self.bypass_field):
+            if field is not None:
+                fields.append(field)
+        return fields
+
+    def rate(self, parent_freq, mul, prediv=0, postdiv=0, frac=0):
+        """
+            Compute the frequency of the PLL from its field values
+
+            :param parent_freq: The parent's frequency
+            :param mul: The value of the multiplier field
+            :param prediv: The value of the pre divider field
+            :param postdiv: The value of the post divider field
+            :param frac: The value of the fractional field
+            :return: The PLL frequency, in Hz
+        """
+        mul = mul + self.mul_offset
+        if self.frac_field is not None:
+            mul = mul + frac / (1 << self.get_frac_bits())
+        div = 1
+        if self.prediv_field is not None:
+            div = prediv + self.prediv_offset
+        if self.postdiv_field is not None:
+            div = div * (postdiv + self.postdiv_offset)
+        return int(parent_freq * mul / div)
+
+    def get_frac_bits(self):
+        """
+            Get the number of fractional bits of the multiplier
 
-    def _get_freq(self):
+            :return: frac_bits if set, or the width of the fractional field
+        """
+        if self.frac_bits is not None:
+            return self.frac_bits
+        return field_bits(self.frac_field)[1]
+
+    def _value(self, field):
+        if field is None:
+            return 0
+        return self._read(field)
+
+    def _freq(self, parent_freq):
         if hasattr(self, 'ext_get_freq') and self.ext_get_freq:
-            return self.ext_get_freq(self)
-        return 0
+            return self._call_ext(self.ext_get_freq, 'get_freq')
+        if self.mul_field is None:
+            return 0
+        if self.bypass_field is not None and \
+           self._read(self.bypass_field) == self.bypass_val:
+            return parent_freq()
+        return self.rate(parent_freq(), self._read(self.mul_field),
+                         self._value(self.prediv_field),
+                         self._value(self.postdiv_field),
+                         self._value(self.frac_field))
 
     def _check(self):
-        if not hasattr(self, 'ext_get_freq') or not self.ext_get_freq:
-            raise MissingAttribute(self.name, 'get_freq')
+        if hasattr(self, 'ext_get_freq') and self.ext_get_freq:
+            return
+        if not hasattr(self, 'mul_field') or self.mul_field is None:
+            raise MissingAttribute(self.name, ['get_freq', 'mul_field'])
+        if not self.parent:
+            raise MissingAttribute(self.name, 'parent')
 
 class Mux(Clock):
     """
         A class that represents a clock multiplexer
     """
+    __slots__ = ('mux_field', 'ext_get_mux', 'parents', 'parent_clocks')
+
     def __init__(self, **kwargs):
+        # parents must be set before the clock is added to the tree,
+        # so the tree could index the mux as a child of each of them.
+        self.parents = freeze_table(kwargs.get('parents', {}))
+        self.parent_clocks = None
         super(Mux, self).__init__(**kwargs)
         self.mux_field = kwargs.get('mux_field', None)
         self.ext_get_mux = kwargs.get('get_mux', None)
-        self.parents = kwargs.get('parents', {})
 
     def _check(self):
         if not self.parents:
@@ -456,21 +1910,43 @@ class Mux(Clock):
             if not parent in self.tree.clocks:
                 raise UnknownClock(parent)
 
+    def get_fields(self):
+        fields = super(Mux, self).get_fields()
+        if self.mux_field is not None:
+            fields.append(self.mux_field)
+        return fields
+
+    def get_tables(self):
+        return [self.parents]
+
     def _get_parent(self):
         if hasattr(self, 'ext_get_mux') and self.ext_get_mux:
-            mux = self.ext_get_mux(self)
+            mux = self._call_ext(self.ext_get_mux, 'get_mux')
         else:
-            mux = int(self.mux_field)
+            mux = self._read(self.mux_field)
+        if mux not in self.parents:
+            raise InvalidMux()
+        if self.tree.sealed:
+            return self.parent_clocks[mux]
         parent_name = self.parents[mux]
         return self.tree.get(parent_name)
 
-    def _get_freq(self):
-        parent = self.get_parent()
-        if parent is None:
+    def seal(self, position):
+        super(Mux, self).seal(position)
+        self.parent_clocks = {mux: self.tree.get(self.parents[mux])
+                              for mux in self.parents}
+
+    def unseal(self):
+        super(Mux, self).unseal()
+        self.parent_clocks = None
+
+    def _freq(self, parent_freq):
+        freq = parent_freq()
+        if freq is None:
             # There are valid case where parent could be none,
             # e.g no clock selected. Return 0 in that case.
             return 0
-        return parent.get_freq()
+        return freq
 
     def _enabled(self):
         parent = self.get_parent()
@@ -482,13 +1958,15 @@ class Divider(Clock):
     """
         A class that represents a Clock divider
     """
+    __slots__ = ('div_table', 'div', 'div_field', 'div_type', 'ext_get_div')
+
     ONE_BASED = 0
     POWER_OF_TWO = 1
     ZERO_TO_GATE = 2
 
     def __init__(self, **kwargs):
         super(Divider, self).__init__(**kwargs)
-        self.div_table = kwargs.get('table', {})
+        self.div_table = freeze_table(kwargs.get('table', {}))
         self.div = kwargs.get('div', None)
         self.div_field = kwargs.get('div_field', None)
         self.div_type = kwargs.get('div_type', self.ONE_BASED)
@@ -500,28 +1978,37 @@ class Divider(Clock):
         if self.div is None and self.div_field is None:
             raise MissingAttributes(self.name, ['div', 'div_field'])
 
+    def get_fields(self):
+        fields = super(Divider, self).get_fields()
+        if self.div_field is not None:
+            fields.append(self.div_field)
+        return fields
+
+    def get_tables(self):
+        return [self.div_table]
+
     def _get_div(self):
         if self.ext_get_div:
-            return self.ext_get_div(self)
+            return self._call_ext(self.ext_get_div, 'get_div')
         if self.div:
             return self.div
         if self.div_field:
             if self.div_table:
-                div = int(self.div_field)
+                div = self._read(self.div_field)
                 if not div in self.div_table:
                     raise InvalidDivider()
                 return self.div_table[div]
             if self.div_type == self.ONE_BASED:
-                return int(self.div_field)
+                return self._read(self.div_field)
             if self.div_type == self.POWER_OF_TWO:
-                return 1 << self.div_field
+                return 1 << self._read(self.div_field)
         raise InvalidDivider()
 
-    def _get_freq(self):
+    def _freq(self, parent_freq):
         div = self._get_div()
         if div is None or (div == 0 and self.div_type == self.ZERO_TO_GATE):
             return 0
-        return int(self.get_parent().get_freq() / div)
+        return int(parent_freq() / div)
 
     def _enabled(self):
         div = self._get_div()
@@ -0,0 +1,495 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+    Provide a flat representation of a clock tree.
+
+    The clocks are stored in topological order, in arrays indexed by
+    clock position. The parents are stored as positions and the fields
+    as positions in a table of fields, so the whole tree could be evaluated
+    in a tight loop, without going through the clock objects.
+"""
+
+from array import array
+
+from regiceclock.clock import Clock, FixedClock, Gate, PLL, Mux, Divider
+from regiceclock.clock import EVAL_ERRORS, InvalidFrequency, InvalidDivider
+from regiceclock.clock import InvalidMux
+
+__all__ = ['CompiledTree']
+
+KIND_CLOCK = 0
+KIND_FIXED = 1
+KIND_GATE = 2
+KIND_PLL = 3
+KIND_MUX = 4
+KIND_DIVIDER = 5
+# Clocks evaluated using the clock object, e.g. user defined clocks
+KIND_OBJECT = 6
+
+# How the divisor of a divider is found
+DIV_CALL = 0
+DIV_FIXED = 1
+DIV_TABLE = 2
+DIV_ONE_BASED = 3
+DIV_POWER_OF_TWO = 4
+
+# Defined out of CompiledTree, whose PLL attribute hides the PLL class
+CLOCK_KINDS = {
+    Clock: KIND_CLOCK,
+    FixedClock: KIND_FIXED,
+    Gate: KIND_GATE,
+    PLL: KIND_PLL,
+    Mux: KIND_MUX,
+    Divider: KIND_DIVIDER,
+}
+
+class CompiledTree:
+    """
+        A class to represent a compiled clock tree
+
+        The compiled tree is a copy of the structure of the clock tree.
+        It must be compiled again if clocks are added or modified,
+        which ClockTree.compile() does when clocks are added.
+    """
+    CLOCK = KIND_CLOCK
+    FIXED = KIND_FIXED
+    GATE = KIND_GATE
+    PLL = KIND_PLL
+    MUX = KIND_MUX
+    DIVIDER = KIND_DIVIDER
+    OBJECT = KIND_OBJECT
+
+    KINDS = CLOCK_KINDS
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.names = list(tree.topological_order())
+        self.index = {name: pos for pos, name in enumerate(self.names)}
+        self.clocks = [tree.clocks[name] for name in self.names]
+        self.fields = []
+        self.field_index = {}
+
+        self.kinds = array('b')
+        # Parent used to compute the frequency, and to propagate the state
+        self.parents = array('l')
+        self.gate_parents = array('l')
+        # Field used to get the state of the clock, and its enabled value
+        self.state_fields = array('l')
+        self.state_vals = []
+        self.mux_fields = array('l')
+        self.mux_parents = []
+        self.div_fields = array('l')
+        self.div_types = array('l')
+        self.div_tables = []
+        # How the divisor is found, the fixed divisor, and True if a
+        # divisor of 0 gates the clock
+        self.div_modes = array('b')
+        self.div_values = []
+        self.div_gates = array('b')
+        # Fields of PLLs computed from their fields: mul, prediv, postdiv,
+        # frac and bypass, or None for other clocks
+        self.pll_fields = []
+        # True if the clock has a frequency range to check
+        self.ranges = array('b')
+
+        for pos, clock in enumerate(self.clocks):
+            clock.check()
+            self._compile(pos, clock)
+
+    def _add_field(self, field):
+        if field is None:
+            return -1
+        key = id(field)
+        if key not in self.field_index:
+            self.field_index[key] = len(self.fields)
+            self.fields.append(field)
+        return self.field_index[key]
+
+    def _position(self, name, pos):
+        if not name:
+            return -1
+        parent = self.index[self.tree.get(name).name]
+        # The parent must be evaluated first, if it is not,
+        # the clock has to be evaluated using the clock object.
+        if parent >= pos:
+            return None
+        return parent
+
+    def _compile(self, pos, clock):
+        kind = self.KINDS.get(type(clock), self.OBJECT)
+        parent = self._position(clock.parent, pos)
+        gate_parent = parent
+        mux_parents = None
+        if kind == self.MUX:
+            mux_parents = {}
+            for mux, parent_name in clock.parents.items():
+                mux_parents[mux] = self._position(parent_name, pos)
+                if mux_parents[mux] is None:
+                    kind = self.OBJECT
+        if parent is None or gate_parent is None:
+            kind = self.OBJECT
+
+        state_field = -1
+        state_val = None
+        if kind in [self.CLOCK, self.FIXED, self.GATE, self.PLL]:
+            if clock.rdy_field:
+                state_field = self._add_field(clock.rdy_field)
+                state_val = clock.rdy_val
+            elif clock.en_field:
+                state_field = self._add_field(clock.en_field)
+                state_val = clock.en_val
+
+        mux_field = -1
+        if kind == self.MUX and not clock.ext_get_mux:
+            mux_field = self._add_field(clock.mux_field)
+
+        div_field = -1
+        div_type = -1
+        div_table = None
+        div_mode = DIV_CALL
+        if kind == self.DIVIDER:
+            div_type = clock.div_type
+            if not clock.ext_get_div and not clock.div and clock.div_field:
+                div_field = self._add_field(clock.div_field)
+                div_table = clock.div_table
+                if div_table:
+                    div_mode = DIV_TABLE
+                elif div_type == Divider.ONE_BASED:
+                    div_mode = DIV_ONE_BASED
+                elif div_type == Divider.POWER_OF_TWO:
+                    div_mode = DIV_POWER_OF_TWO
+            elif not clock.ext_get_div and clock.div:
+                div_mode = DIV_FIXED
+
+        pll_fields = None
+        if kind == self.PLL and not clock.ext_get_freq and \
+           clock.mul_field is not None:
+            pll_fields = tuple(self._add_field(field) for field in
+                               (clock.mul_field, clock.prediv_field,
+                                clock.postdiv_field, clock.frac_field,
+                                clock.bypass_field))
+
+        self.kinds.append(kind)
+        self.parents.append(-1 if parent is None else parent)
+        self.gate_parents.append(-1 if gate_parent is None else gate_parent)
+        self.state_fields.append(state_field)
+        self.state_vals.append(state_val)
+        self.mux_fields.append(mux_field)
+        self.mux_parents.append(mux_parents)
+        self.div_fields.append(div_field)
+        self.div_types.append(div_type)
+        self.div_tables.append(div_table)
+        self.div_modes.append(div_mode)
+        self.div_values.append(clock.div if div_mode == DIV_FIXED else None)
+        self.div_gates.append(div_type == Divider.ZERO_TO_GATE)
+        self.pll_fields.append(pll_fields)
+        self.ranges.append(bool(clock.freq_min or clock.freq_max))
+
+    def read_values(self):
+        """
+            Read the fields used by the compiled tree
+
+            The fields are read through ClockTree.read_field(),
+            so from the snapshot if ClockTree.use_snapshot() is used.
+
+            :return: A tuple with a list of field values, indexed by field
+                     position, and a dictionary of errors for the fields
+                     which could not be read, indexed by field position
+        """
+        values = []
+        failures = {}
+        with self.tree.single_read():
+            for pos, field in enumerate(self.fields):
+                try:
+                    values.append(self.tree.read_field(field))
+                except EVAL_ERRORS as ex:
+                    values.append(None)
+                    failures[pos] = ex
+        return values, failures
+
+    def _select(self, pos, values, failures):
+        clock = self.clocks[pos]
+        field = self.mux_fields[pos]
+        if field < 0:
+            mux = clock._call_ext(clock.ext_get_mux, 'get_mux')
+        else:
+            mux = values[field]
+            if mux is None:
+                raise failures[field]
+        if mux not in self.mux_parents[pos]:
+            raise InvalidMux()
+        return self.mux_parents[pos][mux]
+
+    def _divide(self, pos, values, failures):
+        clock = self.clocks[pos]
+        if clock.ext_get_div:
+            return clock._call_ext(clock.ext_get_div, 'get_div')
+        if clock.div:
+            return clock.div
+        field = self.div_fields[pos]
+        if field < 0:
+            raise InvalidDivider()
+        div = values[field]
+        if div is None:
+            raise failures[field]
+        table = self.div_tables[pos]
+        if table:
+            if not div in table:
+                raise InvalidDivider()
+            return table[div]
+        if self.div_types[pos] == Divider.ONE_BASED:
+            return div
+        if self.div_types[pos] == Divider.POWER_OF_TWO:
+            return 1 << div
+        raise InvalidDivider()
+
+    @staticmethod
+    def _value(field, values, failures):
+        if field < 0:
+            return 0
+        if values[field] is None:
+            raise failures[field]
+        return values[field]
+
+    def _pll(self, pos, freqs, freq_errors, values, failures):
+        clock = self.clocks[pos]
+        mul, prediv, postdiv, frac, bypass = self.pll_fields[pos]
+        parent = self.parents[pos]
+        bypassed = bypass >= 0 and \
+                   self._value(bypass, values, failures) == clock.bypass_val
+        if freq_errors[parent]:
+            raise freq_errors[parent]
+        if bypassed:
+            return freqs[parent]
+        return clock.rate(freqs[parent],
+                          *[self._value(field, values, failures)
+                            for field in (mul, prediv, postdiv, frac)])
+
+    def run(self, values=None, failures=None):
+        """
+            Evaluate the frequency and the state of all the clocks
+
+            :param values: A list of field values, as returned by
+                           read_values(), or None to read the fields
+            :param failures: A dictionary of field errors, as returned by
+                             read_values()
+            :return: A tuple with the frequencies, the frequency errors,
+                     the gated clocks and the state errors, as returned by
+                     ClockTree.evaluate() and ClockTree.evaluate_gating()
+        """
+        if values is None:
+            values, failures = self.read_values()
+        if failures is None:
+            failures = {}
+        count = len(self.names)
+        freqs = [None] * count
+        freq_errors = [None] * count
+        gated = [-1] * count
+        gate_errors = [None] * count
+
+        kinds = self.kinds
+        parents = self.parents
+        gate_parents = self.gate_parents
+        state_fields = self.state_fields
+        state_vals = self.state_vals
+        mux_fields = self.mux_fields
+        mux_parents = self.mux_parents
+        div_fields = self.div_fields
+        div_tables = self.div_tables
+        div_modes = self.div_modes
+        div_values = self.div_values
+        div_gates = self.div_gates
+        ranges = self.ranges
+        clocks = self.clocks
+        # The mux and divider paths are inlined, and the errors are passed
+        # down without being raised, as this is the bulk of the clocks.
+        for pos in range(count):
+            kind = kinds[pos]
+
+            # The selected parent or the divider, shared by freq and state
+            error = None
+            parent = parents[pos]
+            div = None
+            div_gated = False
+            if kind == KIND_MUX:
+                field = mux_fields[pos]
+                if field < 0:
+                    try:
+                        parent = self._select(pos, values, failures)
+                    except EVAL_ERRORS as ex:
+                        error = ex
+                else:
+                    mux = values[field]
+                    if mux is None:
+                        error = failures[field]
+                    else:
+                        parent = mux_parents[pos].get(mux, -2)
+                        if parent == -2:
+                            error = InvalidMux()
+            elif kind == KIND_DIVIDER:
+                mode = div_modes[pos]
+                if mode == DIV_FIXED:
+                    div = div_values[pos]
+                elif mode == DIV_CALL:
+                    try:
+                        div = self._divide(pos, values, failures)
+                    except EVAL_ERRORS as ex:
+                        error = ex
+                else:
+                    value = values[div_fields[pos]]
+                    if value is None:
+                        error = failures[div_fields[pos]]
+                    elif mode == DIV_ONE_BASED:
+                        div = value
+                    elif mode == DIV_POWER_OF_TWO:
+                        div = 1 << value
+                    elif value in div_tables[pos]:
+                        div = div_tables[pos][value]
+                    else:
+                        error = InvalidDivider()
+                if error is None:
+                    div_gated = div is None or (div == 0 and div_gates[pos])
+
+            # State of the clock
+            gate_parent = gate_parents[pos]
+            if gate_parent >= 0 and gate_errors[gate_parent] is not None:
+                gate_errors[pos] = gate_errors[gate_parent]
+            elif gate_parent >= 0 and gated[gate_parent] >= 0:
+                gated[pos] = gated[gate_parent]
+            elif error is not None:
+                gate_errors[pos] = error
+            elif kind == KIND_MUX:
+                if parent < 0:
+                    gated[pos] = pos
+            elif kind == KIND_DIVIDER:
+                if div_gated:
+                    gated[pos] = pos
+            elif kind == KIND_OBJECT:
+                try:
+                    if not clocks[pos]._enabled():
+                        gated[pos] = pos
+                except EVAL_ERRORS as ex:
+                    gate_errors[pos] = ex
+            else:
+                field = state_fields[pos]
+                if field >= 0:
+                    value = values[field]
+                    if value is None:
+                        gate_errors[pos] = failures[field]
+                    elif value != state_vals[pos]:
+                        gated[pos] = pos
+
+            # Frequency of the clock
+            if kind == KIND_GATE or kind == KIND_MUX or kind == KIND_DIVIDER:
+                if error is not None:
+                    freq_errors[pos] = error
+                    continue
+                if div_gated:
+                    freq = 0
+                else:
+                    parent_freq = None
+                    if parent >= 0:
+                        if freq_errors[parent] is not None:
+                            freq_errors[pos] = freq_errors[parent]
+                            continue
+                        parent_freq = freqs[parent]
+                    if kind == KIND_DIVIDER:
+                        if div == 0:
+                            freq_errors[pos] = ZeroDivisionError(
+                                "division by zero")
+                            continue
+                        freq = int(parent_freq / div)
+                    elif kind == KIND_MUX and parent_freq is None:
+                        freq = 0
+                    else:
+                        freq = parent_freq
+                if ranges[pos]:
+                    try:
+                        freq = clocks[pos].check_freq(freq)
+                    except EVAL_ERRORS as ex:
+                        freq_errors[pos] = ex
+                        continue
+                freqs[pos] = freq
+                continue
+
+            clock = clocks[pos]
+            try:
+                if kind == KIND_FIXED:
+                    freq = clock.freq
+                elif kind == KIND_OBJECT:
+                    freq = clock._get_freq()
+                elif kind == KIND_PLL:
+                    freq = 0
+                    if clock.ext_get_freq:
+                        freq = clock._call_ext(clock.ext_get_freq,
+                                               'get_freq')
+                    elif self.pll_fields[pos] is not None:
+                        freq = self._pll(pos, freqs, freq_errors, values,
+                                         failures)
+                else:
+                    raise InvalidFrequency(clock)
+                if ranges[pos]:
+                    freq = clock.check_freq(freq)
+                freqs[pos] = freq
+            except EVAL_ERRORS as ex:
+                freq_errors[pos] = ex
+        return freqs, freq_errors, gated, gate_errors
+
+    def _by_name(self, results):
+        return {self.names[pos]: result for pos, result in enumerate(results)
+                if result is not None}
+
+    def evaluate(self, values=None, failures=None):
+        """
+            Get the frequency of all the clocks
+
+            Same as ClockTree.evaluate(), using the compiled tree.
+
+            :param values: A list of field values, or None to read the fields
+            :param failures: A dictionary of field errors
+            :return: A tuple with a dictionary of clock frequencies,
+                     and a dictionary of errors, both indexed by clock name
+        """
+        freqs, errors, _, _ = self.run(values, failures)
+        return ({self.names[pos]: freq for pos, freq in enumerate(freqs)
+                 if errors[pos] is None},
+                self._by_name(errors))
+
+    def evaluate_gating(self, values=None, failures=None):
+        """
+            Get the state of all the clocks
+
+            Same as ClockTree.evaluate_gating(), using the compiled tree.
+
+            :param values: A list of field values, or None to read the fields
+            :param failures: A dictionary of field errors
+            :return: A tuple with a dictionary of gated clocks,
+                     and a dictionary of errors, both indexed by clock name
+        """
+        _, _, gated, errors = self.run(values, failures)
+        return ({self.names[pos]: self.names[cause]
+                 for pos, cause in enumerate(gated) if cause >= 0},
+                self._by_name(errors))
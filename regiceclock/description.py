@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+    Provide functions to load a clock tree from a description.
+
+    The description is a JSON (or YAML) document listing the clocks,
+    with fields named by path, e.g. "TEST1.TESTA.A1":
+
+        {
+            "peripherals": ["TEST1"],
+            "clocks": [
+                {"type": "fixed", "name": "osc", "freq": 24000000},
+                {"type": "gate", "name": "gate", "parent": "osc",
+                 "en_field": "TEST1.TESTA.A1"}
+            ]
+        }
+
+    Once parsed and validated, the description could be saved to a cache,
+    keyed on the content of the description and of the SVD file, so the
+    next loads don't have to parse and validate it again.
+    PyYAML is an optional dependency, only required to load YAML files.
+"""
+
+import hashlib
+import json
+import marshal
+import os
+import sys
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# The errors raised by the parsers on malformed documents
+PARSE_ERRORS = (ValueError,) if yaml is None else (ValueError, yaml.YAMLError)
+
+from regiceclock.clock import ClockTree, Clock, FixedClock, Gate, PLL, Mux
+from regiceclock.clock import Divider
+
+__all__ = ['InvalidDescription', 'parse_description', 'get_field',
+           'make_clock_tree', 'load_description']
+
+class InvalidDescription(Exception):
+    """
+        An exception raised when a clock tree description is not valid
+    """
+    pass
+
+CLOCK_TYPES = {
+    'clock': Clock,
+    'fixed': FixedClock,
+    'gate': Gate,
+    'pll': PLL,
+    'mux': Mux,
+    'divider': Divider,
+}
+
+DIV_TYPES = {
+    'one_based': Divider.ONE_BASED,
+    'power_of_two': Divider.POWER_OF_TWO,
+    'zero_to_gate': Divider.ZERO_TO_GATE,
+}
+
+FIELD_KEYS = ['en_field', 'rdy_field', 'mux_field', 'div_field', 'mul_field',
+              'prediv_field', 'postdiv_field', 'frac_field', 'bypass_field',
+              'lock_field']
+FIELD_LIST_KEYS = ['depends_on']
+CALLBACK_KEYS = ['get_freq', 'get_mux', 'get_div']
+TABLE_KEYS = ['parents', 'table']
+CLOCK_KEYS = set(['type', 'name', 'parent', 'en_val', 'rdy_val', 'min', 'max',
+                  'freq', 'div', 'div_type', 'mul_offset', 'prediv_offset',
+                  'postdiv_offset', 'frac_bits', 'bypass_val', 'lock_val',
+                  'cache_size'] +
+                 FIELD_KEYS + FIELD_LIST_KEYS + CALLBACK_KEYS + TABLE_KEYS)
+
+CACHE_MAGIC = b'RCDESC'
+CACHE_VERSION = 1
+
+def _parse_table(name, key, table):
+    if not isinstance(table, dict):
+        raise InvalidDescription("{}: {} must be a mapping".format(name, key))
+    try:
+        return {int(value): entry for value, entry in table.items()}
+    except ValueError:
+        raise InvalidDescription("{}: the keys of {} must be integers"
+                                 .format(name, key))
+
+def _parse_clock(spec):
+    if not isinstance(spec, dict) or not isinstance(spec.get('name'), str):
+        raise InvalidDescription("A clock must be a mapping with a name")
+    name = spec['name']
+    if spec.get('type') not in CLOCK_TYPES:
+        raise InvalidDescription("{}: unknown clock type {}"
+                                 .format(name, spec.get('type')))
+    unknown = set(spec) - CLOCK_KEYS
+    if unknown:
+        raise InvalidDescription("{}: unknown keys {}"
+                                 .format(name, ', '.join(sorted(unknown))))
+    for key in FIELD_KEYS:
+        if key in spec and not isinstance(spec[key], str):
+            raise InvalidDescription("{}: {} must be the path of a field"
+                                     .format(name, key))
+    for key in FIELD_LIST_KEYS:
+        if key in spec and (not isinstance(spec[key], list) or
+                            not all(isinstance(path, str)
+                                    for path in spec[key])):
+            raise InvalidDescription("{}: {} must be a list of field paths"
+                                     .format(name, key))
+    clock = dict(spec)
+    for key in TABLE_KEYS:
+        if key in clock:
+            clock[key] = _parse_table(name, key, clock[key])
+    if 'div_type' in clock:
+        if clock['div_type'] not in DIV_TYPES:
+            raise InvalidDescription("{}: unknown divider type {}"
+                                     .format(name, clock['div_type']))
+        clock['div_type'] = DIV_TYPES[clock['div_type']]
+    return clock
+
+def parse_description(text, yaml_format=False):
+    """
+        Parse a clock tree description
+
+        :param text: The description
+        :param yaml_format: True if the description is a YAML document,
+                            False if it is a JSON document
+        :return: A dictionary with the list of clocks and the list of
+                 peripherals' name
+    """
+    try:
+        if yaml_format:
+            if yaml is None:
+                raise ImportError("PyYAML is required to load YAML files")
+            data = yaml.safe_load(text)
+        else:
+            data = json.loads(text)
+    except PARSE_ERRORS as ex:
+        raise InvalidDescription(str(ex))
+    if not isinstance(data, dict) or not isinstance(data.get('clocks'), list):
+        raise InvalidDescription("The description must have a list of clocks")
+    peripherals = data.get('peripherals', [])
+    if not isinstance(peripherals, list) or \
+       not all(isinstance(path, str) for path in peripherals):
+        raise InvalidDescription("The peripherals must be a list of paths")
+    clocks = [_parse_clock(spec) for spec in data['clocks']]
+    names = set()
+    for clock in clocks:
+        if clock['name'] in names:
+            raise InvalidDescription("{}: the clock is defined twice"
+                                     .format(clock['name']))
+        names.add(clock['name'])
+    return {'clocks': clocks, 'peripherals': list(peripherals)}
+
+def get_field(device, path):
+    """
+        Get a field, or any other device object, from its path
+
+        :param device: The device
+        :param path: The path of the object, e.g. "TEST1.TESTA.A1"
+        :return: The object
+    """
+    obj = device
+    for name in path.split('.'):
+        if not hasattr(obj, name):
+            raise InvalidDescription("{} doesn't exist in the device"
+                                     .format(path))
+        obj = getattr(obj, name)
+    return obj
+
+def make_clock_tree(device, description, callbacks=None):
+    """
+        Create the clock tree of a description
+
+        :param device: The device
+        :param description: A description returned by parse_description()
+        :param callbacks: A dictionary of the functions used by the clocks
+                          (get_freq, get_mux, get_div), indexed by name
+        :return: A ClockTree
+    """
+    callbacks = callbacks or {}
+    tree = ClockTree(device)
+    for path in description['peripherals']:
+        tree.add_peripheral(get_field(device, path))
+    for spec in description['clocks']:
+        kwargs = {key: value for key, value in spec.items() if key != 'type'}
+        for key in FIELD_KEYS:
+            if key in kwargs:
+                kwargs[key] = get_field(device, kwargs[key])
+        for key in FIELD_LIST_KEYS:
+            if key in kwargs:
+                kwargs[key] = [get_field(device, path)
+                               for path in kwargs[key]]
+        for key in CALLBACK_KEYS:
+            if key in kwargs:
+                if kwargs[key] not in callbacks:
+                    raise InvalidDescription("{}: unknown callback {}"
+                                             .format(spec['name'],
+                                                     kwargs[key]))
+                kwargs[key] = callbacks[kwargs[key]]
+        CLOCK_TYPES[spec['type']](tree=tree, **kwargs)
+    return tree
+
+def _as_bytes(data):
+    if isinstance(data, str):
+        return data.encode()
+    return data
+
+def load_description(device, path, svd=None, cache_dir=None, callbacks=None):
+    """
+        Load a clock tree from a description file
+
+        The description is parsed, and the clock tree is built to validate
+        it. If cache_dir is set, the validated description is saved to the
+        cache, and loaded from the cache the next time, if neither the
+        description, the SVD file nor the Python version changed.
+
+        :param device: The device
+        :param path: The path of the description, a .yaml or .yml file
+                     for YAML, any other file for JSON
+        :param svd: The content of the SVD file of the device, as str or bytes,
+                    required to use the cache
+        :param cache_dir: The directory of the cache, or None to not cache
+        :param callbacks: A dictionary of the functions used by the clocks,
+                          indexed by name
+        :return: A ClockTree
+    """
+    if cache_dir is not None and svd is None:
+        raise ValueError("The SVD file is required to use the cache")
+    with open(path, 'rb') as file:
+        text = file.read()
+    cache = None
+    if cache_dir is not None:
+        # marshal's format depends on the Python version
+        digest = hashlib.sha256(CACHE_MAGIC + bytes([CACHE_VERSION]))
+        digest.update(sys.implementation.cache_tag.encode())
+        digest.update(bytes([marshal.version]))
+        digest.update(hashlib.sha256(text).digest())
+        digest.update(hashlib.sha256(_as_bytes(svd)).digest())
+        cache = os.path.join(cache_dir, digest.hexdigest() + '.rcd')
+        description = load_cache(cache)
+        if description is not None:
+            return make_clock_tree(device, description, callbacks)
+
+    yaml_format = os.path.splitext(path)[1] in ['.yaml', '.yml']
+    description = parse_description(text, yaml_format)
+    tree = make_clock_tree(device, description, callbacks)
+    if not tree.build():
+        raise InvalidDescription("The clock tree of {} is not valid"
+                                 .format(path))
+    if cache is not None:
+        save_cache(cache, description)
+    return tree
+
+def load_cache(path):
+    """
+        Load a description from the cache
+
+        :param path: The path of the cache file
+        :return: The description, or None if the cache file doesn't exist
+                 or is not valid
+    """
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+    except OSError:
+        return None
+    if not data.startswith(CACHE_MAGIC):
+        return None
+    try:
+        return marshal.loads(data[len(CACHE_MAGIC):])
+    except (EOFError, ValueError, TypeError):
+        return None
+
+def save_cache(path, description):
+    """
+        Save a description to the cache
+
+        :param path: The path of the cache file
+        :param description: The description
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = path + '.tmp'
+    with open(temp, 'wb') as file:
+        file.write(CACHE_MAGIC + marshal.dumps(description))
+    os.replace(temp, path)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+    Provide a function to evaluate the clock trees of many devices.
+
+    The register reads of a device are mostly spent waiting for the
+    link to the board, so the devices are evaluated concurrently,
+    on a pool of threads.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = ['InvalidFleet', 'DeviceClocks', 'evaluate_device', 'evaluate_fleet']
+
+class InvalidFleet(Exception):
+    """
+        An exception raised when the clock trees can't be evaluated together
+    """
+    pass
+
+DeviceClocks = namedtuple('DeviceClocks', ['device', 'freqs', 'gated',
+                                           'errors', 'error'])
+
+def evaluate_device(tree, device, clocks=None):
+    """
+        Evaluate the frequency and the state of the clocks of a device
+
+        :param tree: The clock tree of the device
+        :param device: The device of the clock tree, used to identify
+                       the results
+        :param clocks: A list of clock names, or None for all the clocks
+        :return: A DeviceClocks
+    """
+    try:
+        with tree.single_read():
+            freqs, freq_errors = tree.evaluate(clocks)
+            gated, gate_errors = tree.evaluate_gating(clocks)
+    except Exception as ex:
+        return DeviceClocks(device, {}, {}, {}, ex)
+    errors = dict(gate_errors)
+    errors.update(freq_errors)
+    return DeviceClocks(device, freqs, gated, errors, None)
+
+def evaluate_fleet(trees, max_workers=8, clocks=None):
+    """
+        Evaluate the clock trees of many devices concurrently
+
+        The clocks are evaluated on the device of each clock tree, so each
+        board needs its own clock tree, e.g. one loaded by load_description()
+        for each device. A clock tree is not thread safe, so it can't be
+        shared between boards. An error that prevents evaluating a device,
+        e.g. a link failure, doesn't stop the evaluation of the others.
+
+        :param trees: A list of (ClockTree, device) tuples, device being the
+                      device of the clock tree
+        :param max_workers: The maximum number of devices evaluated at once
+        :param clocks: A list of clock names, or None for all the clocks
+        :return: A list of DeviceClocks, in the order of trees. errors holds
+                 the errors of clocks whose frequency or state could not be
+                 determined, indexed by clock name, and error the exception
+                 that prevented evaluating the device, or None.
+    """
+    seen = set()
+    for tree, device in trees:
+        if tree.device is not device:
+            raise InvalidFleet("The clock tree is not bound to the device {}"
+                               .format(device))
+        if id(tree) in seen:
+            raise InvalidFleet("The clock tree of the device {} is shared "
+                               "with another device".format(device))
+        seen.add(id(tree))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(evaluate_device, tree, device, clocks)
+                   for tree, device in trees]
+        return [future.result() for future in futures]
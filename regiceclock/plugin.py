@@ -51,5 +51,7 @@ def process_args(device, args):
             mul = 1000000
         if name in device.tree.clocks:
             clock = device.tree.get(name)
+            if not hasattr(clock, 'freq'):
+                continue
             clock.freq = float(value) * mul
     return {}
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+    Provide classes to find the setting of a clock giving a rate.
+
+    The settings of a clock (divider values, mux inputs) are indexed once,
+    sorted, so the setting giving the rate the closest to a target is found
+    using a binary search.
+"""
+
+from bisect import bisect_right
+
+from regiceclock.clock import Mux, Divider, EVAL_ERRORS
+from regiceclock.snapshot import field_bits
+
+__all__ = ['DividerRates', 'MuxRates', 'make_rate_index']
+
+# The number of values of a power of two divider field that are indexed
+MAX_SHIFTS = 64
+
+def _in_range(clock, rate):
+    if clock.freq_min and rate < clock.freq_min:
+        return False
+    if clock.freq_max and clock.freq_max < rate:
+        return False
+    return True
+
+def _min_div(parent_freq, target):
+    """
+        Get the lowest divisor giving a rate not above the target
+    """
+    target = max(target, 0)
+    # int(parent_freq / div) <= target if div > parent_freq / (target + 1)
+    div = int(parent_freq / (target + 1)) + 1
+    # Fix the divisor if the float division was not exact
+    while div > 1 and int(parent_freq / (div - 1)) <= target:
+        div -= 1
+    while int(parent_freq / div) > target:
+        div += 1
+    return div
+
+class DividerRates:
+    """
+        A class to index the divisors of a divider
+
+        The divisors of a one based divider are all the values of its field,
+        so they are not indexed, the divisor is computed from the target.
+
+        :param clock: The divider
+    """
+    def __init__(self, clock):
+        self.field = clock.div_field
+        self.max_div = None
+        settings = {}
+        if clock.div_table:
+            for value, div in clock.div_table.items():
+                if div:
+                    settings.setdefault(div, value)
+        elif clock.div_type == Divider.ONE_BASED:
+            _, width = field_bits(clock.div_field)
+            self.max_div = (1 << width) - 1
+        elif clock.div_type == Divider.POWER_OF_TWO:
+            _, width = field_bits(clock.div_field)
+            for value in range(min(1 << width, MAX_SHIFTS)):
+                settings.setdefault(1 << value, value)
+        self.divs = sorted(settings)
+        self.values = [settings[div] for div in self.divs]
+
+    def _round_one_based(self, clock, parent_freq, target):
+        # The divisors giving a rate in the clock's range
+        low = 1
+        high = self.max_div
+        if clock.freq_max:
+            low = max(low, _min_div(parent_freq, clock.freq_max))
+        if clock.freq_min:
+            high = min(high, _min_div(parent_freq, clock.freq_min - 1) - 1)
+        if low > high:
+            return None
+        div = max(low, min(_min_div(parent_freq, target), high))
+        return div, int(parent_freq / div)
+
+    def round(self, clock, target):
+        """
+            Find the setting giving the highest rate not above the target,
+            or the lowest rate if they are all above the target
+
+            Settings giving a rate outside of the clock's range are skipped.
+
+            :param clock: The divider
+            :param target: The target rate
+            :return: A tuple with the field value and the rate, or None
+                     if the divider has no setting in the clock's range
+        """
+        if self.max_div is None and not self.divs:
+            return None
+        parent_freq = clock.tree.get_freq(clock.parent)
+        if self.max_div is not None:
+            return self._round_one_based(clock, parent_freq, target)
+        # int(parent_freq / div) <= target if div > parent_freq / (target + 1)
+        pos = bisect_right(self.divs, parent_freq / (target + 1))
+        pos = min(pos, len(self.divs) - 1)
+        # Fix the position if the float division was not exact
+        if pos and int(parent_freq / self.divs[pos - 1]) <= target:
+            pos -= 1
+        elif pos < len(self.divs) - 1 and \
+             int(parent_freq / self.divs[pos]) > target:
+            pos += 1
+        if clock.freq_min or clock.freq_max:
+            # The rates decrease with the divisors, so the settings in
+            # the clock's range are contiguous
+            valid = [index for index, div in enumerate(self.divs)
+                     if _in_range(clock, int(parent_freq / div))]
+            if not valid:
+                return None
+            pos = max(valid[0], min(pos, valid[-1]))
+        return self.values[pos], int(parent_freq / self.divs[pos])
+
+class MuxRates:
+    """
+        A class to index the inputs of a mux
+
+        :param clock: The mux
+    """
+    def __init__(self, clock):
+        self.field = clock.mux_field
+        self.settings = {}
+        for value, parent in clock.parents.items():
+            if parent is not None:
+                self.settings.setdefault(parent, value)
+
+    def round(self, clock, target):
+        """
+            Find the input giving the highest rate not above the target,
+            or the lowest rate if they are all above the target
+
+            Inputs giving a rate outside of the clock's range are skipped.
+
+            :param clock: The mux
+            :param target: The target rate
+            :return: A tuple with the field value and the rate, or None
+                     if no input has a valid rate
+        """
+        rates = []
+        for parent, value in self.settings.items():
+            try:
+                rate = clock.tree.get_freq(parent)
+            except EVAL_ERRORS:
+                continue
+            if _in_range(clock, rate):
+                rates.append((rate, value))
+        if not rates:
+            return None
+        rates.sort()
+        pos = max(bisect_right(rates, (target, float('inf'))) - 1, 0)
+        rate, value = rates[pos]
+        return value, rate
+
+def make_rate_index(clock):
+    """
+        Index the settings of a clock
+
+        :param clock: The clock
+        :return: A DividerRates or a MuxRates, or None if the rate of the
+                 clock can't be changed using one of its fields
+    """
+    if isinstance(clock, Divider):
+        if clock.ext_get_div or clock.div or not clock.div_field:
+            return None
+        if not clock.div_table and clock.div_type == Divider.ZERO_TO_GATE:
+            return None
+        return DividerRates(clock)
+    if isinstance(clock, Mux):
+        if clock.ext_get_mux or clock.mux_field is None:
+            return None
+        return MuxRates(clock)
+    return None
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+    Provide a class to save the state of registers.
+
+    A snapshot holds the values of the registers used by a clock tree.
+    It could be saved to a file, loaded later, and used instead of
+    the device to evaluate the clock tree.
+"""
+
+import struct
+import time
+
+__all__ = ['InvalidSnapshot', 'MissingRegister', 'Snapshot', 'field_bits',
+           'field_key', 'field_value']
+
+class InvalidSnapshot(Exception):
+    """
+        An exception raised when a snapshot file could not be loaded
+    """
+    pass
+
+class MissingRegister(Exception):
+    """
+        An exception raised when the snapshot doesn't have a register
+    """
+    def __init__(self, address):
+        super().__init__("The register 0x{:x} is not in the snapshot"
+                         .format(address))
+
+def field_bits(field):
+    """
+        Get the position of a field in its register
+
+        :param field: The field
+        :return: A tuple with the offset and the width of the field, in bits
+    """
+    return field.svd.bitOffset, field.svd.bitWidth
+
+def field_key(field):
+    """
+        Get a key identifying a field
+
+        Fields are not hashable, so this could be used to index them.
+
+        :param field: The field
+        :return: A tuple with the address of the field's register,
+                 and the offset and the width of the field, in bits
+    """
+    return (field.register.address(),) + field_bits(field)
+
+def field_value(field, value):
+    """
+        Extract the value of a field from the value of its register
+
+        :param field: The field
+        :param value: The value of the field's register
+        :return: The value of the field
+    """
+    offset, width = field_bits(field)
+    return (value >> offset) & ((1 << width) - 1)
+
+class Snapshot:
+    """
+        A class to represent the values of registers at a given time
+
+        The snapshot is immutable, and the values are indexed by
+        register address.
+    """
+    MAGIC = b'RCSNAP'
+    VERSION = 1
+    HEADER = struct.Struct('<6sHdI')
+    ENTRY = struct.Struct('<QQ')
+
+    __slots__ = ('_registers', '_timestamp')
+
+    def __init__(self, registers, timestamp=None):
+        self._registers = dict(registers)
+        if timestamp is None:
+            timestamp = time.time()
+        self._timestamp = timestamp
+
+    @property
+    def timestamp(self):
+        """
+            The time at which the registers have been read
+        """
+        return self._timestamp
+
+    def __getitem__(self, address):
+        if address not in self._registers:
+            raise MissingRegister(address)
+        return self._registers[address]
+
+    def __contains__(self, address):
+        return address in self._registers
+
+    def __iter__(self):
+        return iter(self._registers)
+
+    def __len__(self):
+        return len(self._registers)
+
+    def __eq__(self, other):
+        if not isinstance(other, Snapshot):
+            return NotImplemented
+        return self._registers == other._registers
+
+    def __hash__(self):
+        return hash(frozenset(self._registers.items()))
+
+    def items(self):
+        """
+            Get the registers' address and value
+
+            :return: An iterator of (address, value) tuples
+        """
+        return self._registers.items()
+
+    def read_field(self, field):
+        """
+            Get the value of a field
+
+            :param field: The field to read
+            :return: The value of the field
+        """
+        return field_value(field, self[field.register.address()])
+
+    def to_bytes(self):
+        """
+            Serialize the snapshot
+
+            :return: The snapshot, as bytes
+        """
+        data = [self.HEADER.pack(self.MAGIC, self.VERSION,
+                                 self._timestamp, len(self._registers))]
+        for address in sorted(self._registers):
+            data.append(self.ENTRY.pack(address, self._registers[address]))
+        return b''.join(data)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+            Deserialize a snapshot
+
+            :param data: A snapshot serialized by to_bytes()
+            :return: A snapshot
+        """
+        if len(data) < cls.HEADER.size:
+            raise InvalidSnapshot("The snapshot is truncated")
+        magic, version, timestamp, count = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            raise InvalidSnapshot("This is not a clock snapshot")
+        if version != cls.VERSION:
+            raise InvalidSnapshot("Unsupported snapshot version {}"
+                                  .format(version))
+        if len(data) != cls.HEADER.size + count * cls.ENTRY.size:
+            raise InvalidSnapshot("The snapshot is truncated")
+        registers = {}
+        for entry in range(count):
+            offset = cls.HEADER.size + entry * cls.ENTRY.size
+            address, value = cls.ENTRY.unpack_from(data, offset)
+            registers[address] = value
+        return cls(registers, timestamp)
+
+    def save(self, path):
+        """
+            Save the snapshot to a file
+
+            :param path: The path of the file
+        """
+        with open(path, 'wb') as file:
+            file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        """
+            Load a snapshot from a file
+
+            :param path: The path of the file
+            :return: A snapshot
+        """
+        with open(path, 'rb') as file:
+            return cls.from_bytes(file.read())
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+    Provide classes to instrument clock tree operations.
+
+    The statistics are recorded per public operation of the clock tree
+    (get_freq, is_gated, make_tree, prefetch): number of calls, of field
+    reads, of external callbacks invocations, and the time spent, split by
+    clock kind.
+"""
+
+import time
+from contextlib import contextmanager
+
+__all__ = ['OperationStats', 'TreeStats']
+
+# Operation charged for the work done outside of any recorded operation
+OTHER = 'other'
+
+class NoStats:
+    """
+        A context doing nothing, used instead of operation() and timing()
+        when the statistics are disabled
+    """
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+NO_STATS = NoStats()
+
+class OperationStats:
+    """
+        A class to hold the statistics of an operation
+    """
+    __slots__ = ('calls', 'reads', 'ext_calls', 'time', 'kind_times')
+
+    def __init__(self):
+        self.calls = 0
+        self.reads = 0
+        self.ext_calls = {}
+        self.time = 0.0
+        self.kind_times = {}
+
+    def __repr__(self):
+        return "OperationStats(calls={}, reads={}, ext_calls={}, " \
+               "time={:.6f}, kind_times={})".format(self.calls, self.reads,
+                                                    self.ext_calls, self.time,
+                                                    self.kind_times)
+
+class TreeStats:
+    """
+        A class to record the statistics of the clock tree operations
+
+        The time spent in a clock kind is exclusive, e.g. the time spent in
+        a mux doesn't include the time spent by the PLL called by its
+        get_mux() callback. Operations called by another one, e.g. by an
+        external callback, are charged to the outermost operation.
+    """
+    def __init__(self):
+        self.operations = {}
+        self.current = None
+        self.kinds = []
+        self.start = None
+
+    def get(self, operation):
+        """
+            Get the statistics of an operation
+
+            :param operation: The name of the operation
+            :return: An OperationStats
+        """
+        if operation not in self.operations:
+            self.operations[operation] = OperationStats()
+        return self.operations[operation]
+
+    def _current(self):
+        if self.current is None:
+            return self.get(OTHER)
+        return self.current
+
+    @contextmanager
+    def operation(self, name):
+        """
+            A context in which the statistics are charged to an operation
+
+            :param name: The name of the operation
+        """
+        if self.current is not None:
+            yield
+            return
+        self.current = self.get(name)
+        self.current.calls += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current.time += time.perf_counter() - start
+            self.current = None
+
+    @contextmanager
+    def timing(self, clock):
+        """
+            A context in which the time is charged to the clock's kind
+
+            :param clock: The clock being evaluated
+        """
+        now = time.perf_counter()
+        if self.kinds:
+            self._charge(self.kinds[-1], now)
+        self.kinds.append(type(clock).__name__)
+        self.start = now
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self._charge(self.kinds.pop(), now)
+            self.start = now
+
+    def call(self, clock, function, *args):
+        """
+            Call a function, and charge the time spent to the clock's kind
+
+            :param clock: The clock being evaluated
+            :param function: The function to call
+            :return: The value returned by the function
+        """
+        with self.timing(clock):
+            return function(*args)
+
+    def _charge(self, kind, now):
+        times = self._current().kind_times
+        times[kind] = times.get(kind, 0.0) + now - self.start
+
+    def read(self):
+        """
+            Count a field read
+        """
+        self._current().reads += 1
+
+    def ext_call(self, callback):
+        """
+            Count an external callback invocation
+
+            :param callback: The name of the callback, e.g. get_freq
+        """
+        ext_calls = self._current().ext_calls
+        ext_calls[callback] = ext_calls.get(callback, 0) + 1
+
+    def reset(self):
+        """
+            Forget all the statistics
+        """
+        self.operations.clear()
+
+    def report(self):
+        """
+            Get the statistics as a dictionary
+
+            :return: A dictionary of statistics, indexed by operation name
+        """
+        return {name: {'calls': stats.calls, 'reads': stats.reads,
+                       'ext_calls': dict(stats.ext_calls),
+                       'time': stats.time,
+                       'kind_times': dict(stats.kind_times)}
+                for name, stats in self.operations.items()}
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# MIT License
+#
+# Copyright (c) 2018 BayLibre
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+    Benchmarks of the clock tree operations.
+
+    This generates synthetic clock trees, as large as the ones of a SoC,
+    and measures the wall time, the number of Python calls, and the number
+    of register reads of the main clock tree operations.
+"""
+
+import argparse
+import cProfile
+import pstats
+import random
+import time
+
+from svd import SVDText
+from libregice.regiceclienttest import RegiceClientTest
+from libregice.device import Device
+from regiceclock import FixedClock, Gate, Mux, ClockTree, Divider, EVAL_ERRORS
+from regiceclock import field_bits
+from regicetest import open_svd_file
+
+OPERATIONS = ['build', 'get_orphans', 'make_tree', 'get_freq', 'is_gated',
+              'evaluate', 'evaluate_gating', 'compile', 'compiled_run', 'walk',
+              'prefetch', 'prefetch_clocks']
+
+# The widest field used to select a mux input or a divisor
+MAX_SELECT_WIDTH = 4
+
+class ReadCounter:
+    """
+        Count the register reads done through a client
+    """
+    def __init__(self, client):
+        self.client = client
+        self.count = 0
+        self.read = client.read
+        client.read = self._read
+
+    def _read(self, *args, **kwargs):
+        self.count += 1
+        return self.read(*args, **kwargs)
+
+def get_registers(dev):
+    """
+        Get all the registers of a device
+
+        :param dev: The device
+        :return: A list of registers
+    """
+    return [register for peripheral in dev.peripherals.values()
+            for register in peripheral.registers.values()]
+
+def make_device():
+    """
+        Create a test device
+    """
+    file = open_svd_file('test.svd')
+    svd = SVDText(file.read())
+    svd.parse()
+    client = RegiceClientTest()
+    dev = Device(svd, client)
+    # Registers the test client doesn't hold are read as 0
+    for register in get_registers(dev):
+        client.memory.setdefault(register.address(), 0)
+    return dev, client
+
+def make_synthetic_tree(dev, clocks=1000, depth=8, fan_in=2,
+                        dividers=0.4, muxes=0.1, seed=0):
+    """
+        Generate a synthetic clock tree
+
+        The clocks are spread over depth levels, the parents of a clock
+        being picked in the previous level. The fields used by the clocks
+        are picked among all the fields of the device, so the clocks use
+        many registers, of many peripherals, as on a SoC.
+
+        :param dev: The device whose fields are used by the clocks
+        :param clocks: The number of clocks
+        :param depth: The number of levels, below the oscillators
+        :param fan_in: The number of parents of the muxes
+        :param dividers: The ratio of dividers
+        :param muxes: The ratio of muxes, the other clocks being gates
+        :param seed: The seed of the random generator
+        :return: A ClockTree
+    """
+    rand = random.Random(seed)
+    tree = ClockTree(dev)
+    fields = [field for register in get_registers(dev)
+              for field in register.fields.values()]
+    select_fields = [field for field in fields
+                     if field_bits(field)[1] <= MAX_SELECT_WIDTH]
+    for peripheral in dev.peripherals.values():
+        tree.add_peripheral(peripheral)
+
+    levels = [['osc{}'.format(index) for index in range(max(fan_in, 2))]]
+    for index, name in enumerate(levels[0]):
+        FixedClock(name=name, tree=tree, freq=24000000 * (index + 1))
+
+    per_level = max(1, (clocks - len(levels[0])) // depth)
+    for index in range(clocks - len(levels[0])):
+        level = min(index // per_level + 1, depth)
+        if level == len(levels):
+            levels.append([])
+        name = 'clk{}'.format(index)
+        parents = levels[level - 1]
+        kind = rand.random()
+        select_field = rand.choice(select_fields)
+        select_values = 1 << field_bits(select_field)[1]
+        if kind < muxes:
+            # Every value of the field selects one of the fan_in parents
+            selected = [rand.choice(parents) for _ in range(fan_in)]
+            mux_parents = {mux: selected[mux % fan_in]
+                           for mux in range(select_values)}
+            Mux(name=name, tree=tree, mux_field=select_field,
+                parents=mux_parents)
+        elif kind < muxes + dividers:
+            parent = rand.choice(parents)
+            div_type = rand.choice(['div', Divider.ONE_BASED,
+                                    Divider.POWER_OF_TWO, 'table'])
+            if div_type == 'div':
+                Divider(name=name, tree=tree, parent=parent,
+                        div=rand.randint(1, 8))
+            elif div_type == 'table':
+                Divider(name=name, tree=tree, parent=parent,
+                        div_field=select_field,
+                        table={div: 1 << div for div in range(select_values)})
+            else:
+                Divider(name=name, tree=tree, parent=parent,
+                        div_field=select_field, div_type=div_type)
+        else:
+            Gate(name=name, tree=tree, parent=rand.choice(parents),
+                 en_field=rand.choice(fields))
+        levels[level].append(name)
+    return tree
+
+def _get_freqs(tree):
+    for clock_name in tree.clocks:
+        try:
+            tree.get_freq(clock_name)
+        except EVAL_ERRORS:
+            pass
+
+def _is_gated(tree):
+    for clock_name in tree.clocks:
+        try:
+            tree.is_gated(clock_name)
+        except EVAL_ERRORS:
+            pass
+
+def _walk(tree):
+    for _ in tree.walk():
+        pass
+
+def measure(function, counter):
+    """
+        Measure an operation
+
+        :param function: The operation to measure
+        :param counter: A ReadCounter
+        :return: A dictionary with the wall time in seconds, the number of
+                 Python calls and the number of register reads
+    """
+    reads = counter.count
+    start = time.perf_counter()
+    function()
+    wall = time.perf_counter() - start
+    reads = counter.count - reads
+
+    profile = cProfile.Profile()
+    profile.runcall(function)
+    calls = pstats.Stats(profile).total_calls
+    return {'time': wall, 'calls': calls, 'reads': reads}
+
+def run_benchmarks(clocks=1000, depth=8, fan_in=2, dividers=0.4, muxes=0.1,
+                   operations=None):
+    """
+        Generate a synthetic clock tree and measure the clock operations
+
+        :return: A dictionary of measures, indexed by operation
+    """
+    dev, client = make_device()
+    tree = make_synthetic_tree(dev, clocks, depth, fan_in, dividers, muxes)
+    sample = list(tree.clocks)[::10]
+    counter = ReadCounter(client)
+    benchmarks = {
+        'build': tree.build,
+        'get_orphans': tree.get_orphans,
+        'make_tree': tree.make_tree,
+        'get_freq': lambda: _get_freqs(tree),
+        'is_gated': lambda: _is_gated(tree),
+        'evaluate': tree.evaluate,
+        'evaluate_gating': tree.evaluate_gating,
+        'compile': lambda: tree.compile(recompile=True),
+        'compiled_run': lambda: tree.compile().run(),
+        'walk': lambda: _walk(tree),
+        'prefetch': tree.prefetch,
+        'prefetch_clocks': lambda: tree.prefetch(clocks=sample),
+    }
+    results = {}
+    for operation in operations or OPERATIONS:
+        results[operation] = measure(benchmarks[operation], counter)
+    return results
+
+def print_results(results):
+    """
+        Print the measures as a table
+    """
+    print("{:<16} {:>12} {:>12} {:>12}".format('operation', 'time (ms)',
+                                               'calls', 'reads'))
+    for operation, result in results.items():
+        print("{:<16} {:>12.2f} {:>12} {:>12}".format(
+            operation, result['time'] * 1000, result['calls'],
+            result['reads']))
+
+def main():
+    parser = argparse.ArgumentParser(description='Clock tree benchmarks')
+    parser.add_argument('--clocks', type=int, default=1000)
+    parser.add_argument('--depth', type=int, default=8)
+    parser.add_argument('--fan-in', type=int, default=2)
+    parser.add_argument('--dividers', type=float, default=0.4)
+    parser.add_argument('--muxes', type=float, default=0.1)
+    parser.add_argument('operations', nargs='*', metavar='operation',
+                        help='One of: ' + ', '.join(OPERATIONS))
+    args = parser.parse_args()
+    for operation in args.operations:
+        if operation not in OPERATIONS:
+            parser.error("Unknown operation {}".format(operation))
+    print_results(run_benchmarks(args.clocks, args.depth, args.fan_in,
+                                 args.dividers, args.muxes, args.operations))
+
+if __name__ == '__main__':
+    main()
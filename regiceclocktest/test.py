@@ -23,15 +23,42 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
 import unittest
 import warnings
+from unittest import mock
 
 from svd import SVDText
 from libregice.regiceclienttest import RegiceClientTest
 from libregice.device import Device
 from regiceclock import FixedClock, Clock, Gate, Mux, ClockTree, Divider, PLL
 from regiceclock import InvalidDivider, UnknownClock, InvalidFrequency
+from regiceclock import InvalidMux
+from regiceclock import SealedTree, MissingAttribute, ClockCycle
+from regiceclock import Snapshot, InvalidSnapshot, MissingRegister
+from regiceclock import CompiledTree
+from regiceclock import BatchEvaluator, evaluate_fleet, InvalidFleet
+from regiceclock import ClientReader, ThreadedReader, read_snapshot
+from regiceclock import load_description, InvalidDescription
+from regiceclock import FOREVER
 from regicetest import open_svd_file
+from regiceclocktest.bench import make_synthetic_tree, run_benchmarks
+from regiceclocktest.bench import OPERATIONS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
 
 def ext_get_freq(clk):
     return 1234
@@ -42,6 +69,13 @@ def ext_enable(clk):
 def ext_disable(clk):
     return clk.en_field.write(0)
 
+def run_async(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
 class ClockTestCase(unittest.TestCase):
     @classmethod
     def setUpClass(self):
@@ -95,6 +129,22 @@ class TestClock(ClockTestCase):
         with self.assertRaises(InvalidFrequency):
             clk.get_freq()
 
+    def test_get_freq_override(self):
+        class MyClock(Clock):
+            def _get_freq(self):
+                return 42
+
+        tree = ClockTree(self.dev)
+        MyClock(tree=tree, name='test1')
+        Gate(tree=tree, name='test2', parent='test1',
+             en_field=self.dev.TEST1.TESTA.A1)
+        self.assertEqual(tree.get_freq('test1'), 42)
+        self.assertEqual(tree.get_freq('test2'), 42)
+        compiled_tree = tree.compile()
+        freqs = compiled_tree.run()[0]
+        self.assertEqual(freqs[compiled_tree.index['test2']], 42)
+        self.assertEqual(tree.get_all_freqs(), {'test1': 42, 'test2': 42})
+
 class TestGate(ClockTestCase):
     def test_enabled(self):
         field = self.dev.TEST1.TESTA.A1
@@ -205,6 +255,37 @@ class TestMux(ClockTestCase):
         self.assertTrue(mux.enabled())
         self.dev.TEST1.TESTA.A3.write(3)
 
+    def test_unlisted_selector(self):
+        tree = ClockTree(self.dev)
+        FixedClock(name='test0', tree=tree, freq=1234)
+        FixedClock(name='test1', tree=tree, freq=4321)
+        Mux(name='mux', tree=tree, parents={0: 'test0', 1: 'test1'},
+            mux_field=self.mux_field)
+        Gate(name='gate', tree=tree, parent='mux',
+             en_field=self.dev.TEST1.TESTA.A1)
+        self.mux_field.write(3)
+        with self.assertRaises(InvalidMux):
+            tree.get_freq('mux')
+
+        freqs, errors = tree.evaluate()
+        self.assertEqual(freqs, {'test0': 1234, 'test1': 4321})
+        self.assertIsInstance(errors['mux'], InvalidMux)
+        self.assertIsInstance(errors['gate'], InvalidMux)
+        gated, errors = tree.evaluate_gating()
+        self.assertIsInstance(errors['mux'], InvalidMux)
+        self.assertIn('mux', [name for _, name, _, _, _ in tree.walk()])
+
+        compiled_tree = tree.compile()
+        freqs, errors = compiled_tree.evaluate()
+        self.assertEqual(freqs, {'test0': 1234, 'test1': 4321})
+        self.assertIsInstance(errors['mux'], InvalidMux)
+        self.assertIn('gate', compiled_tree.evaluate_gating()[1])
+
+        tree.build(seal=True)
+        with self.assertRaises(InvalidMux):
+            tree.get_freq('mux')
+        tree.unseal()
+
 def ext_get_div(div):
     return 3
 
@@ -331,6 +412,99 @@ class TestPLL(ClockTestCase):
         self.assertFalse(pll.build())
         pll = PLL(tree=self.tree, get_freq=ext_get_freq)
         self.assertTrue(pll.build())
+        pll = PLL(tree=self.tree, mul_field=self.dev.TEST1.TESTA.A3)
+        self.assertFalse(pll.build())
+
+    def test_model(self):
+        tree = ClockTree(self.dev)
+        FixedClock(name='osc', tree=tree, freq=1000000)
+        pll = PLL(name='pll', tree=tree, parent='osc',
+                  mul_field=self.dev.TEST1.TESTA.A3, mul_offset=4,
+                  frac_field=self.dev.TEST1.TESTA.A3, frac_bits=2,
+                  prediv_field=self.dev.TEST1.TESTA.A1, prediv_offset=1,
+                  bypass_field=self.dev.TEST1.TESTA.A2,
+                  lock_field=self.dev.TEST1.TESTA.A2, lock_val=0)
+        Divider(name='div', tree=tree, parent='pll', div=3)
+        self.assertTrue(pll.build())
+        self.assertEqual(len(pll.get_fields()), 5)
+
+        self.dev.TEST1.TESTA.A3.write(2)
+        self.dev.TEST1.TESTA.A1.write(1)
+        self.dev.TEST1.TESTA.A2.write(0)
+        self.assertEqual(tree.get_freq('pll'), 1000000 * 6.5 / 2)
+        self.assertEqual(tree.get_freq('div'), 1000000 * 6.5 // 2 // 3)
+        self.assertFalse(tree.is_gated('pll'))
+        self.assertEqual(tree.compile().evaluate(), tree.evaluate())
+        snapshots = [tree.snapshot()]
+
+        self.dev.TEST1.TESTA.A2.write(1)
+        self.assertEqual(tree.get_freq('pll'), 1000000)
+        self.assertTrue(tree.is_gated('pll'))
+        self.assertEqual(tree.compile().evaluate(), tree.evaluate())
+        snapshots.append(tree.snapshot())
+
+        if numpy is None:
+            return
+        batch = BatchEvaluator(tree)
+        self.assertEqual(batch.unsupported, [])
+        freqs, gated, invalid = batch.evaluate(batch.values(snapshots))
+        pos = batch.names.index('pll')
+        self.assertEqual(list(freqs[:, pos]), [3250000, 1000000])
+        self.assertEqual(list(gated[:, pos]), [False, True])
+
+class TestCallbackCache(ClockTestCase):
+    def test_cache(self):
+        calls = []
+        def get_div(div):
+            calls.append(div.name)
+            return int(self.dev.TEST1.TESTA.A3) + 1
+
+        tree = ClockTree(self.dev)
+        FixedClock(name='osc', tree=tree, freq=1200)
+        Divider(name='div', tree=tree, parent='osc', get_div=get_div,
+                depends_on=[self.dev.TEST1.TESTA.A3], cache_size=2)
+        self.assertIn(self.dev.TEST1.TESTA.A3, tree.get('div').get_fields())
+
+        self.dev.TEST1.TESTA.A3.write(1)
+        self.assertEqual(tree.get_freq('div'), 600)
+        self.assertEqual(tree.get_freq('div'), 600)
+        self.assertEqual(len(calls), 1)
+
+        self.dev.TEST1.TESTA.A3.write(2)
+        self.assertEqual(tree.get_freq('div'), 400)
+        self.dev.TEST1.TESTA.A3.write(1)
+        self.assertEqual(tree.compile().evaluate()[0]['div'], 600)
+        self.assertEqual(len(calls), 2)
+
+        # Only the two most recently used results are kept
+        self.dev.TEST1.TESTA.A3.write(3)
+        self.assertEqual(tree.get_freq('div'), 300)
+        self.dev.TEST1.TESTA.A3.write(2)
+        self.assertEqual(tree.get_freq('div'), 400)
+        self.assertEqual(len(calls), 4)
+        cache = tree.get('div').ext_cache
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+        # The results are dropped on a new epoch
+        tree.invalidate()
+        self.assertEqual(tree.get_freq('div'), 400)
+        self.assertEqual(len(calls), 5)
+
+        # The results are not used with a snapshot
+        with tree.use_snapshot(tree.snapshot()):
+            self.assertEqual(tree.get_freq('div'), 400)
+            self.assertEqual(tree.get_freq('div'), 400)
+        self.assertEqual(len(calls), 7)
+
+class AsyncClient:
+    def __init__(self, client):
+        self.client = client
+        self.reads = []
+
+    async def read(self, width, address):
+        self.reads.append(address)
+        await asyncio.sleep(0)
+        return self.client.read(width, address)
 
 class TestClockTree(ClockTestCase):
     @classmethod
@@ -418,6 +592,124 @@ class TestClockTree(ClockTestCase):
         self.assertEqual(len(children), 2)
         self.assertIn('mux1', children)
 
+    def test_children_index(self):
+        tree = ClockTree(self.dev)
+        FixedClock(name='osc1', tree=tree, freq=1234)
+        FixedClock(name='osc2', tree=tree, freq=2345)
+        Mux(name='mux1', tree=tree, mux_field=self.dev.TEST1.TESTA.A3,
+            parents={0: 'osc1', 1: 'osc2'})
+        Divider(name='div1', tree=tree, div=2, parent='osc1')
+        self.assertIn('mux1', tree.get_children('osc2'))
+        self.assertNotIn('mux1', tree.get_orphans())
+
+        Divider(name='div1', tree=tree, div=2, parent='osc2')
+        self.assertNotIn('div1', tree.get_children('osc1'))
+        self.assertIn('div1', tree.get_children('osc2'))
+
+        tree.clocks.pop('div1')
+        self.assertNotIn('div1', tree.get_children('osc2'))
+
+    def test_seal(self):
+        tree = ClockTree(self.dev)
+        FixedClock(name='osc1', tree=tree, freq=1234)
+        FixedClock(name='osc2', tree=tree, freq=2345)
+        Mux(name='mux1', tree=tree, mux_field=self.dev.TEST1.TESTA.A3,
+            parents={0: 'osc1', 1: 'osc2', 3: None})
+        gate = Gate(name='gate1', tree=tree, parent='mux1',
+                    en_field=self.dev.TEST1.TESTA.A1)
+        Divider(name='div1', tree=tree, parent='foo')
+        self.assertFalse(tree.build(seal=True))
+        self.assertFalse(tree.sealed)
+        tree.clocks.pop('div1')
+
+        # A parent that doesn't exist fails the build, instead of the seal
+        Gate(name='gate2', tree=tree, parent='nope',
+             en_field=self.dev.TEST1.TESTA.A1)
+        self.assertFalse(tree.build(seal=True))
+        self.assertFalse(tree.sealed)
+        with self.assertRaises(UnknownClock):
+            tree.seal()
+        self.assertIsNone(gate.parent_clock)
+        tree.clocks.pop('gate2')
+
+        self.assertTrue(tree.build(seal=True))
+        self.assertTrue(tree.sealed)
+        self.assertEqual(gate.depth, 2)
+        self.assertEqual(gate.position, 3)
+        self.assertIs(gate.get_parent(), tree.get('mux1'))
+        with self.assertRaises(SealedTree):
+            FixedClock(name='osc3', tree=tree, freq=5432)
+
+        self.dev.TEST1.TESTA.A3.write(1)
+        self.assertEqual(tree.get_freq('gate1'), 2345)
+        self.dev.TEST1.TESTA.A3.write(3)
+        self.assertEqual(tree.get_freq('gate1'), 0)
+
+        # The clocks are not checked anymore
+        gate.en_field = None
+        self.assertEqual(tree.get_freq('gate1'), 0)
+        tree.unseal()
+        with self.assertRaises(MissingAttribute):
+            tree.get_freq('gate1')
+        FixedClock(name='osc3', tree=tree, freq=5432)
+
+    def test_cycle(self):
+        tree = ClockTree(self.dev)
+        FixedClock(name='osc', tree=tree, freq=1234)
+        Mux(name='mux', tree=tree, mux_field=self.dev.TEST1.TESTA.A3,
+            parents={0: 'osc', 1: 'div'})
+        Divider(name='div', tree=tree, parent='mux', div=2)
+        Gate(name='gate', tree=tree, parent='div',
+             en_field=self.dev.TEST1.TESTA.A1)
+        self.assertEqual(tree.find_cycle(), ['mux', 'div', 'mux'])
+        self.assertFalse(tree.build())
+        with self.assertRaises(ClockCycle):
+            tree.seal()
+
+        self.dev.TEST1.TESTA.A3.write(0)
+        self.assertEqual(tree.get_freq('gate'), 617)
+        self.dev.TEST1.TESTA.A3.write(1)
+        with self.assertRaises(ClockCycle):
+            tree.get_freq('gate')
+        freqs, errors = tree.evaluate()
+        self.assertEqual(list(freqs), ['osc'])
+        self.assertIsInstance(errors['gate'], ClockCycle)
+
+        Gate(name='osc2', tree=tree, parent='gate2',
+             en_field=self.dev.TEST1.TESTA.A1)
+        Gate(name='gate2', tree=tree, parent='osc2',
+             en_field=self.dev.TEST1.TESTA.A1)
+        with self.assertRaises(ClockCycle):
+            tree.is_gated('gate2')
+
+    def test_deep_tree(self):
+        tree = ClockTree(self.dev)
+        FixedClock(name='osc', tree=tree, freq=1234)
+        parent = 'osc'
+        for index in range(sys.getrecursionlimit() * 2):
+            Gate(name='gate{}'.format(index), tree=tree, parent=parent,
+                 en_field=self.dev.TEST1.TESTA.A1)
+            parent = 'gate{}'.format(index)
+        self.dev.TEST1.TESTA.A1.write(1)
+        self.assertTrue(tree.build())
+        self.assertEqual(tree.get_freq(parent), 1234)
+        self.assertFalse(tree.is_gated(parent))
+
+    def test_memory_report(self):
+        report = self.tree.memory_report()
+        self.assertEqual(report['FixedClock']['count'], 3)
+        self.assertEqual(report['Divider']['count'], 3)
+        self.assertEqual(report['tables']['count'], 2)
+        self.assertGreater(report['Gate']['bytes'], 0)
+
+        clock = self.tree.get('gate1')
+        self.assertFalse(hasattr(clock, '__dict__'))
+        with self.assertRaises(TypeError):
+            self.tree.get('mux1').parents[0] = 'osc2'
+
+        mux = Mux(parents={0: 'osc1', 1: 'osc2', 2: 'osc3', 3: 'osc3'})
+        self.assertIs(mux.parents, self.tree.get('mux1').parents)
+
     def test_make_tree(self):
         tree = self.tree.make_tree()
         self.assertIn('osc1', tree)
@@ -427,6 +719,28 @@ class TestClockTree(ClockTestCase):
         self.assertNotIn('mux1', tree['osc2'])
         self.assertIn('mux1', tree['osc3'])
 
+    def test_walk(self):
+        self.dev.TEST1.TESTA.A2.write(0)
+        records = list(self.tree.walk())
+        names = [record[1] for record in records]
+        self.assertEqual(names, ['osc1', 'div1', 'gate1', 'osc2', 'osc3',
+                                 'mux1', 'div2', 'gate2', 'div3'])
+        for depth, name, clock, freq, enabled in records:
+            self.assertIs(clock, self.tree.get(name))
+            self.assertEqual(freq, self.tree.get_freq(name))
+            self.assertEqual(enabled, not self.tree.is_gated(name))
+        self.assertEqual(records[-1][0], 4)
+
+        with self.tree.use_snapshot(Snapshot({})):
+            records = list(self.tree.walk())
+        names = [record[1] for record in records]
+        self.assertEqual(sorted(names), sorted(set(names)))
+        self.assertIn('mux1', names)
+        for depth, name, clock, freq, enabled in records:
+            if name in ('mux1', 'div2', 'gate2', 'div3'):
+                self.assertIsNone(freq)
+                self.assertIsNone(enabled)
+
     def test_peripherals_warning(self):
         self.tree.peripherals = []
         with warnings.catch_warnings(record=True) as warning:
@@ -468,6 +782,676 @@ class TestClockTree(ClockTestCase):
         self.assertEqual(parent.name, 'osc1')
         self.tree.cache_disable()
 
+    def test_topological_order(self):
+        order = self.tree.topological_order()
+        self.assertEqual(len(order), len(self.tree.clocks))
+        for parent, child in [('osc1', 'mux1'), ('osc3', 'mux1'),
+                              ('mux1', 'div2'), ('gate2', 'div3')]:
+            self.assertLess(order.index(parent), order.index(child))
+
+    def test_evaluate(self):
+        freqs, errors = self.tree.evaluate()
+        self.assertEqual(errors, {})
+        for clock_name in self.tree.clocks:
+            self.assertEqual(freqs[clock_name],
+                             self.tree.get_freq(clock_name))
+
+        tree = ClockTree(self.dev)
+        FixedClock(name='osc', tree=tree, freq=1234, max=1000)
+        FixedClock(name='osc2', tree=tree, freq=1234)
+        Gate(name='gate', tree=tree, parent='osc',
+             en_field=self.dev.TEST1.TESTA.A1)
+        Divider(name='div', tree=tree, parent='osc2', get_div=ext_get_div_zero)
+        freqs, errors = tree.evaluate()
+        self.assertEqual(freqs, {'osc2': 1234})
+        self.assertIsInstance(errors['osc'], InvalidFrequency)
+        self.assertIsInstance(errors['gate'], InvalidFrequency)
+        self.assertIsInstance(errors['div'], ZeroDivisionError)
+        self.assertEqual(tree.get_all_freqs(), freqs)
+
+    def test_evaluate_gating(self):
+        self.dev.TEST1.TESTA.A1.write(1)
+        self.dev.TEST1.TESTA.A2.write(0)
+        gated, errors = self.tree.evaluate_gating()
+        self.assertEqual(errors, {})
+        self.assertEqual(gated, {'gate2': 'gate2', 'div3': 'gate2'})
+        for clock_name in self.tree.clocks:
+            self.assertEqual(clock_name in gated,
+                             self.tree.is_gated(clock_name))
+
+        self.dev.TEST1.TESTA.A2.write(1)
+        self.assertEqual(self.tree.get_all_gating(), {})
+
+    def test_compile(self):
+        compiled = self.tree.compile()
+        self.assertIs(self.tree.compile(), compiled)
+        for a2 in [0, 1]:
+            for a3 in [0, 1, 3]:
+                self.dev.TEST1.TESTA.A2.write(a2)
+                self.dev.TEST1.TESTA.A3.write(a3)
+                self.assertEqual(compiled.evaluate(), self.tree.evaluate())
+                self.assertEqual(compiled.evaluate_gating(),
+                                 self.tree.evaluate_gating())
+
+        tree = ClockTree(self.dev)
+        FixedClock(name='osc', tree=tree, freq=1234, max=1000)
+        FixedClock(name='osc2', tree=tree, freq=1234)
+        Gate(name='gate', tree=tree, parent='osc',
+             en_field=self.dev.TEST1.TESTA.A1)
+        Divider(name='div', tree=tree, parent='osc2', get_div=ext_get_div_zero)
+        Divider(name='div2', tree=tree, parent='osc2',
+                div_field=self.dev.TEST1.TESTA.A3, table={0: 2, 1: 4})
+        Divider(name='div3', tree=tree, parent='osc2',
+                div_field=self.dev.TEST1.TESTA.A3,
+                div_type=Divider.POWER_OF_TWO)
+        PLL(name='pll', tree=tree, parent='osc2', get_freq=ext_get_freq)
+        Mux(name='mux', tree=tree, get_mux=ext_get_mux,
+            parents={0: 'pll', 1: 'gate'})
+        compiled_tree = tree.compile()
+        pll = compiled_tree.index['pll']
+        self.assertEqual(compiled_tree.kinds[pll], CompiledTree.PLL)
+        freqs, errors = compiled_tree.evaluate()
+        expected_freqs, expected_errors = tree.evaluate()
+        self.assertEqual(freqs, expected_freqs)
+        self.assertEqual(set(errors), set(expected_errors))
+        self.assertIsInstance(errors['div2'], InvalidDivider)
+        self.assertEqual(freqs['div3'], 1234 >> 3)
+        self.assertEqual(freqs['mux'], 1234)
+        self.assertEqual(tree.compile().evaluate_gating()[0],
+                         tree.evaluate_gating()[0])
+
+        snapshot = self.tree.snapshot()
+        self.dev.TEST1.TESTA.A3.write(0)
+        with self.tree.use_snapshot(snapshot):
+            self.assertEqual(compiled.evaluate()[0]['mux1'], 5432)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_batch(self):
+        batch = BatchEvaluator(self.tree)
+        self.assertEqual(batch.unsupported, [])
+        snapshots = []
+        for a2 in [0, 1]:
+            for a3 in [0, 1, 3]:
+                self.dev.TEST1.TESTA.A2.write(a2)
+                self.dev.TEST1.TESTA.A3.write(a3)
+                snapshots.append(self.tree.snapshot())
+        freqs, gated, invalid = batch.evaluate(batch.values(snapshots))
+        self.assertEqual(freqs.shape, (6, len(self.tree.clocks)))
+        self.assertFalse(invalid.any())
+        for row, snapshot in enumerate(snapshots):
+            with self.tree.use_snapshot(snapshot):
+                expected_freqs = self.tree.get_all_freqs()
+                expected_gated = self.tree.get_all_gating()
+            for pos, clock_name in enumerate(batch.names):
+                self.assertEqual(freqs[row, pos], expected_freqs[clock_name])
+                self.assertEqual(gated[row, pos], clock_name in expected_gated)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_batch_divider(self):
+        tree = ClockTree(self.dev)
+        field = self.dev.TEST1.TESTA.A3
+        FixedClock(name='osc', tree=tree, freq=1000, min=10)
+        Divider(name='one', tree=tree, parent='osc', div_field=field)
+        Divider(name='pow', tree=tree, parent='osc', div_field=field,
+                div_type=Divider.POWER_OF_TWO)
+        Divider(name='table', tree=tree, parent='osc', div_field=field,
+                div_type=Divider.ZERO_TO_GATE, table={0: 0, 1: 3, 3: 8})
+        Divider(name='none', tree=tree, parent='osc', div_field=field,
+                table={0: None, 1: 2})
+        Divider(name='ext', tree=tree, parent='osc', get_div=ext_get_div)
+        batch = BatchEvaluator(tree)
+        self.assertEqual(batch.unsupported, ['ext'])
+        freqs, gated, invalid = batch.evaluate([[0], [1], [2], [3]])
+        column = {name: pos for pos, name in enumerate(batch.names)}
+
+        self.assertTrue(numpy.isnan(freqs[0, column['one']]))
+        self.assertEqual(list(freqs[1:, column['one']]), [1000, 500, 333])
+        self.assertEqual(list(freqs[:, column['pow']]), [1000, 500, 250, 125])
+        self.assertEqual(list(freqs[[0, 1, 3], column['table']]),
+                         [0, 333, 125])
+        self.assertEqual(list(gated[:, column['table']]),
+                         [True, False, False, False])
+        self.assertTrue(invalid[2, column['table']])
+        self.assertTrue(invalid[:, column['ext']].all())
+
+        # A divisor of None gates the clock, as in the object model
+        self.assertEqual(list(freqs[:2, column['none']]), [0, 500])
+        self.assertEqual(list(gated[:2, column['none']]), [True, False])
+        self.assertEqual(list(invalid[:, column['none']]),
+                         [False, False, True, True])
+        field.write(0)
+        self.assertEqual(tree.get_all_freqs()['none'], 0)
+        self.assertIn('none', tree.get_all_gating())
+
+    def test_memoize(self):
+        self.dev.TEST1.TESTA.A2.write(1)
+        self.tree.memoize_enable()
+        self.assertEqual(self.tree.get_freq('div3'), 5432 / 8)
+        self.assertFalse(self.tree.is_gated('div3'))
+
+        # Writing the fields directly starts a new epoch
+        self.dev.TEST1.TESTA.A2.write(0)
+        self.dev.TEST1.TESTA.A3.write(0)
+        self.assertEqual(self.tree.get_freq('div3'), 1234 // 4 // 2)
+        self.assertTrue(self.tree.is_gated('div3'))
+
+        self.tree.write_field(self.dev.TEST1.TESTA.A2, 1)
+        self.assertFalse(self.tree.is_gated('div3'))
+
+        # The registers changed by the device are not seen
+        self.memory[self.dev.TEST1.TESTA.address()] &= ~0x20
+        self.assertFalse(self.tree.is_gated('div3'))
+        self.tree.invalidate()
+        self.assertTrue(self.tree.is_gated('div3'))
+
+        # The writes are not watched anymore once disabled
+        self.tree.memoize_enable()
+        self.tree.memoize_disable()
+        epoch = self.tree.epoch
+        self.dev.TEST1.TESTA.A2.write(1)
+        self.assertEqual(self.tree.epoch, epoch)
+
+    def test_stats(self):
+        self.dev.TEST1.TESTA.A2.write(1)
+        self.assertIsNone(self.tree.stats)
+        with self.tree.profile() as stats:
+            self.assertEqual(self.tree.get_freq('div3'), 5432 / 8)
+            self.assertFalse(self.tree.is_gated('div3'))
+            self.tree.make_tree()
+        self.assertIsNone(self.tree.stats)
+
+        report = stats.report()
+        self.assertEqual(sorted(report), ['get_freq', 'is_gated', 'make_tree'])
+        self.assertEqual(report['get_freq']['calls'], 1)
+        self.assertEqual(report['get_freq']['reads'], 1)
+        self.assertEqual(report['is_gated']['reads'], 2)
+        self.assertEqual(sorted(report['get_freq']['kind_times']),
+                         ['Divider', 'FixedClock', 'Gate', 'Mux'])
+        self.assertEqual(list(report['make_tree']['kind_times']), ['Mux'])
+        for operation in report.values():
+            self.assertGreaterEqual(operation['time'],
+                                    sum(operation['kind_times'].values()))
+
+        tree = ClockTree(self.dev)
+        PLL(name='pll', tree=tree, get_freq=ext_get_freq)
+        Divider(name='div', tree=tree, parent='pll', get_div=ext_get_div)
+        stats = tree.stats_enable()
+        self.assertEqual(tree.get_freq('div'), 1234 // 3)
+        self.assertEqual(tree.compile().evaluate()[0]['div'], 1234 // 3)
+        self.assertEqual(stats.get('get_freq').ext_calls,
+                         {'get_freq': 1, 'get_div': 1})
+        self.assertEqual(stats.get('other').ext_calls,
+                         {'get_freq': 1, 'get_div': 1})
+        tree.stats_disable()
+        self.assertIsNone(tree.stats)
+
+    def test_cache_ttl(self):
+        self.dev.TEST1.TESTA.A2.write(1)
+        now = [0]
+        reads = []
+        read = self.client.read
+        self.client.read = lambda *args: reads.append(args) or read(*args)
+        self.tree.peripherals = [self.dev.TEST1]
+        # The configuration is kept while the cache is disabled
+        self.tree.set_cache_ttl(self.dev.TEST1, 10)
+        self.tree.cache_ttl_enable(ttl=1, timer=lambda: now[0])
+        try:
+            # The registers of other peripherals use the default time to live
+            address = self.dev.TEST1.TESTA.address()
+            self.assertEqual(self.tree.register_cache.get_ttl(address), 10)
+            self.assertEqual(self.tree.register_cache.get_ttl(
+                address + 0x1000000), 1)
+
+            self.assertFalse(self.tree.is_gated('div3'))
+            self.assertFalse(self.tree.is_gated('div3'))
+            self.assertEqual(len(reads), 1)
+
+            # The cached registers expire after their time to live
+            self.dev.TEST1.TESTA.A2.write(0)
+            self.assertFalse(self.tree.is_gated('div3'))
+            now[0] = 10
+            self.assertTrue(self.tree.is_gated('div3'))
+            self.assertEqual(self.tree.register_cache.misses, 2)
+
+            self.tree.set_cache_ttl(self.dev.TEST1, FOREVER)
+            now[0] = 1000
+            self.assertTrue(self.tree.is_gated('div3'))
+            self.assertEqual(self.tree.register_cache.misses, 2)
+
+            # Volatile registers are always read, here for A2 and A3
+            self.tree.set_volatile(self.dev.TEST1.TESTA.A2)
+            self.dev.TEST1.TESTA.A2.write(1)
+            self.assertFalse(self.tree.is_gated('div3'))
+            self.assertEqual(self.tree.register_cache.misses, 4)
+        finally:
+            self.tree.cache_ttl_disable()
+            self.client.read = read
+        self.assertIsNone(self.tree.register_cache)
+
+        self.tree.set_cache_ttl(self.dev.TEST1, 1)
+        self.tree.cache_ttl_enable(timer=lambda: now[0])
+        self.assertEqual(self.tree.register_cache.get_ttl(
+            self.dev.TEST1.TESTA.address()), 0)
+        self.tree.cache_ttl_disable()
+        self.tree.cache_ttls = {}
+        self.tree.volatile = set()
+
+    def test_get_registers(self):
+        self.assertEqual(self.tree.get_ancestors(['osc1']), ['osc1'])
+        ancestors = self.tree.get_ancestors(['div2'])
+        self.assertEqual(sorted(ancestors),
+                         ['div2', 'mux1', 'osc1', 'osc2', 'osc3'])
+
+        address = self.dev.TEST1.TESTA.address()
+        self.assertEqual(list(self.tree.get_registers(['div1'])), [])
+        self.assertEqual(list(self.tree.get_registers(['div3'])), [address])
+        self.assertEqual(list(self.tree.get_registers()), [address])
+
+    def test_prefetch_clocks(self):
+        self.tree.peripherals = [self.dev.TEST1]
+        address = self.dev.TEST1.TESTA.address()
+
+        self.client.memory[address] &= 0xfffffff0
+        self.tree.cache_enable()
+        self.tree.prefetch(clocks=['div2'])
+        parent = self.tree.get('mux1').get_parent()
+        self.assertEqual(parent.name, 'osc1')
+        self.tree.cache_disable()
+
+    def test_snapshot(self):
+        self.dev.TEST1.TESTA.A2.write(1)
+        address = self.dev.TEST1.TESTA.address()
+        snapshot = self.tree.snapshot()
+        self.assertEqual(list(snapshot), [address])
+        self.assertEqual(snapshot[address], self.client.memory[address])
+
+        self.dev.TEST1.TESTA.A2.write(0)
+        self.dev.TEST1.TESTA.A3.write(0)
+        with self.tree.use_snapshot(snapshot):
+            self.assertEqual(self.tree.get_freq('div3'), 5432 / 8)
+            self.assertFalse(self.tree.is_gated('div3'))
+        self.assertEqual(self.tree.get_freq('div3'), 1234 // 4 // 2)
+        self.assertTrue(self.tree.is_gated('div3'))
+
+        with self.tree.use_snapshot(Snapshot({})):
+            freqs, errors = self.tree.evaluate()
+            self.assertIn('osc1', freqs)
+            self.assertIsInstance(errors['div3'], MissingRegister)
+
+    def test_enable(self):
+        self.dev.TEST1.TESTA.A1.write(0)
+        self.dev.TEST1.TESTA.A2.write(0)
+        writes = []
+        write = self.client.write
+        self.client.write = lambda *args: writes.append(args) or write(*args)
+        try:
+            self.tree.enable('div3', 'gate1')
+            self.assertEqual(len(writes), 1)
+            self.assertFalse(self.tree.is_gated('div3'))
+            self.assertFalse(self.tree.is_gated('gate1'))
+
+            self.tree.enable('gate2')
+            self.assertEqual(len(writes), 1)
+
+            self.tree.disable('gate1', 'gate2')
+            self.assertEqual(len(writes), 2)
+            self.assertTrue(self.tree.is_gated('div3'))
+            self.assertTrue(self.tree.is_gated('gate1'))
+            self.assertEqual(int(self.dev.TEST1.TESTA.A3), 3)
+        finally:
+            self.client.write = write
+
+    def test_round_rate(self):
+        self.assertEqual(self.tree.round_rate('mux1', 3000), 2345)
+        self.assertEqual(self.tree.round_rate('mux1', 100), 1234)
+        self.assertEqual(self.tree.set_rate('mux1', 6000), 5432)
+        self.assertIn(int(self.dev.TEST1.TESTA.A3), [2, 3])
+        self.assertEqual(self.tree.round_rate('osc1', 100), 1234)
+        self.assertEqual(self.tree.set_rate('div2', 100), 5432 // 4)
+
+        tree = ClockTree(self.dev)
+        FixedClock(name='osc', tree=tree, freq=5432)
+        Divider(name='one', tree=tree, parent='osc',
+                div_field=self.dev.TEST1.TESTA.A3)
+        Divider(name='pow', tree=tree, parent='osc',
+                div_field=self.dev.TEST1.TESTA.A3,
+                div_type=Divider.POWER_OF_TWO)
+        Divider(name='table', tree=tree, parent='osc',
+                div_field=self.dev.TEST1.TESTA.A3,
+                table={0: None, 1: 3, 2: 5})
+        self.assertEqual(tree.round_rate('one', 3000), 5432 // 2)
+        self.assertEqual(tree.round_rate('one', 5432 // 2), 5432 // 2)
+        self.assertEqual(tree.round_rate('one', 100), 5432 // 3)
+        self.assertEqual(tree.round_rate('one', 10000), 5432)
+        for target in range(0, 6000, 7):
+            rates = [5432 // div for div in range(1, 4)]
+            expected = max([rate for rate in rates if rate <= target] or
+                           [min(rates)])
+            self.assertEqual(tree.round_rate('one', target), expected)
+        self.assertEqual(tree.round_rate('pow', 1000), 5432 // 8)
+        self.assertEqual(tree.round_rate('table', 1500), 5432 // 5)
+        self.assertEqual(tree.set_rate('table', 2000), 5432 // 3)
+        self.assertEqual(int(self.dev.TEST1.TESTA.A3), 1)
+        self.assertEqual(tree.set_rate('pow', 1400), 5432 // 4)
+        self.assertEqual(int(self.dev.TEST1.TESTA.A3), 2)
+
+    def test_round_rate_range(self):
+        field = self.dev.TEST1.TESTA.A3
+        tree = ClockTree(self.dev)
+        FixedClock(name='osc', tree=tree, freq=5432)
+        FixedClock(name='slow', tree=tree, freq=100)
+        Divider(name='one', tree=tree, parent='osc', div_field=field,
+                min=2000)
+        Divider(name='max', tree=tree, parent='osc', div_field=field,
+                max=3000)
+        Divider(name='pow', tree=tree, parent='osc', div_field=field,
+                div_type=Divider.POWER_OF_TWO, min=1000)
+        Divider(name='none', tree=tree, parent='osc', div_field=field,
+                min=6000)
+        Mux(name='mux', tree=tree, mux_field=field, min=1000,
+            parents={0: 'slow', 1: 'osc'})
+
+        self.assertEqual(tree.set_rate('one', 100), 5432 // 2)
+        self.assertEqual(int(field), 2)
+        self.assertEqual(tree.round_rate('max', 10000), 5432 // 2)
+        self.assertEqual(tree.round_rate('max', 100), 5432 // 3)
+        self.assertEqual(tree.round_rate('pow', 100), 5432 // 4)
+        self.assertEqual(tree.set_rate('mux', 100), 5432)
+        self.assertEqual(int(field), 1)
+
+        # No setting is in range, the field is left untouched
+        with self.assertRaises(InvalidFrequency):
+            tree.set_rate('none', 100)
+        self.assertEqual(int(field), 1)
+
+    def test_async(self):
+        self.dev.TEST1.TESTA.A3.write(1)
+        client = AsyncClient(self.client)
+        reader = ClientReader(client)
+        freq = run_async(self.tree.aget_freq('div3', reader))
+        self.assertEqual(freq, self.tree.get_freq('div3'))
+        self.assertEqual(client.reads, [self.dev.TEST1.TESTA.address()])
+        self.assertEqual(run_async(self.tree.aget_freq(None)), 0)
+
+        freqs = run_async(self.tree.aevaluate(reader=ThreadedReader()))
+        self.assertEqual(freqs, self.tree.evaluate())
+        freqs, errors = run_async(self.tree.aevaluate(['gate1'], reader))
+        self.assertEqual(freqs, {'osc1': 1234, 'div1': 1234 // 2,
+                                 'gate1': 1234 // 2})
+
+        # The threaded reads are not concurrent, as clients are not
+        # thread safe
+        active = [0, 0]
+        read = self.client.read
+        def slow_read(*args):
+            active[0] += 1
+            active[1] = max(active)
+            time.sleep(0.001)
+            active[0] -= 1
+            return read(*args)
+        self.client.read = slow_read
+        register = self.dev.TEST1.TESTA
+        try:
+            snapshot = run_async(read_snapshot({address: register
+                                                for address in range(8)}))
+        finally:
+            self.client.read = read
+        self.assertEqual(len(snapshot), 8)
+        self.assertEqual(active[1], 1)
+
+    def test_clocks_affected_by(self):
+        self.assertTrue(self.tree.build())
+        a1 = self.dev.TEST1.TESTA.A1
+        a3 = self.dev.TEST1.TESTA.A3
+        self.assertEqual(self.tree.clocks_affected_by(a1), ('gate1',))
+        self.assertEqual(self.tree.clocks_affected_by(a3),
+                         ('mux1', 'div2', 'gate2', 'div3'))
+        register = self.dev.TEST1.TESTA
+        self.assertEqual(set(self.tree.clocks_affected_by(register)),
+                         {'mux1', 'div2', 'gate1', 'gate2', 'div3'})
+        self.assertEqual(self.tree.clocks_affected_by(register.address()),
+                         self.tree.clocks_affected_by(register))
+        self.assertEqual(self.tree.clocks_affected_by(0), ())
+
+        tree = ClockTree(self.dev)
+        FixedClock(name='osc', tree=tree, freq=1234)
+        self.assertEqual(tree.clocks_affected_by(a1), ())
+        Gate(name='gate', tree=tree, parent='osc', en_field=a1)
+        self.assertEqual(tree.clocks_affected_by(a1), ('gate',))
+
+        tree = ClockTree(self.dev)
+        Gate(name='a', tree=tree, parent='b', en_field=a1)
+        Gate(name='b', tree=tree, parent='a', en_field=a1)
+        self.assertEqual(sorted(tree.clocks_affected_by(a1)), ['a', 'b'])
+        a1.write(0)
+        old = tree.snapshot()
+        a1.write(1)
+        self.assertEqual(sorted(tree.get_changed_clocks(old, tree.snapshot())),
+                         ['a', 'b'])
+
+    def test_diff(self):
+        self.dev.TEST1.TESTA.A1.write(1)
+        self.dev.TEST1.TESTA.A2.write(1)
+        old = self.tree.snapshot()
+        self.assertEqual(self.tree.diff(old), [])
+
+        self.dev.TEST1.TESTA.A2.write(0)
+        changes = self.tree.diff(old)
+        self.assertEqual([change.name for change in changes],
+                         ['gate2', 'div3'])
+        self.assertTrue(changes[0].old_enabled)
+        self.assertFalse(changes[0].new_enabled)
+        self.assertEqual(changes[0].old_freq, changes[0].new_freq)
+
+        self.dev.TEST1.TESTA.A3.write(0)
+        new = self.tree.snapshot()
+        self.assertEqual(self.tree.get_changed_clocks(old, new),
+                         ['mux1', 'gate2'])
+        changes = {change.name: change for change in self.tree.diff(old, new)}
+        self.assertNotIn('gate1', changes)
+        self.assertEqual(changes['mux1'].old_freq, 5432)
+        self.assertEqual(changes['mux1'].new_freq, 1234)
+        self.assertEqual(changes['div3'].new_freq, 1234 // 4 // 2)
+        self.assertEqual(changes['div3'].timestamp, new.timestamp)
+
+    def test_watch(self):
+        self.dev.TEST1.TESTA.A2.write(1)
+        snapshot = self.tree.snapshot()
+        self.assertEqual(list(self.tree.watch(0, 2, snapshot)), [])
+
+        self.dev.TEST1.TESTA.A2.write(0)
+        changes = list(self.tree.watch(0, 2, snapshot))
+        self.assertEqual([change.name for change in changes],
+                         ['gate2', 'div3'])
+        self.assertFalse(changes[1].new_enabled)
+
+    def test_snapshot_file(self):
+        snapshot = Snapshot({0x1000: 3, 0x2000: 0xffffffff}, 1234.5)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'clocks.snap')
+            snapshot.save(path)
+            loaded = Snapshot.load(path)
+        self.assertEqual(loaded, snapshot)
+        self.assertEqual(loaded.timestamp, 1234.5)
+
+        data = snapshot.to_bytes()
+        with self.assertRaises(InvalidSnapshot):
+            Snapshot.from_bytes(data[:-1])
+        with self.assertRaises(InvalidSnapshot):
+            Snapshot.from_bytes(b'X' + data[1:])
+
+DESCRIPTION = {
+    'peripherals': ['TEST1'],
+    'clocks': [
+        {'type': 'fixed', 'name': 'osc1', 'freq': 1234},
+        {'type': 'fixed', 'name': 'osc2', 'freq': 5432},
+        {'type': 'mux', 'name': 'mux1', 'mux_field': 'TEST1.TESTA.A3',
+         'parents': {'0': 'osc1', '1': 'osc2', '2': 'osc2', '3': None}},
+        {'type': 'divider', 'name': 'div1', 'parent': 'mux1',
+         'div_field': 'TEST1.TESTA.A3', 'div_type': 'power_of_two'},
+        {'type': 'gate', 'name': 'gate1', 'parent': 'div1',
+         'en_field': 'TEST1.TESTA.A1'},
+        {'type': 'pll', 'name': 'pll1', 'get_freq': 'pll'},
+        {'type': 'pll', 'name': 'pll2', 'parent': 'osc1',
+         'mul_field': 'TEST1.TESTA.A3', 'mul_offset': 1,
+         'lock_field': 'TEST1.TESTA.A1'},
+    ],
+}
+
+class TestDescription(ClockTestCase):
+    def setUp(self):
+        super(TestDescription, self).setUp()
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'clocks.json')
+        self.cache = os.path.join(self.dir.name, 'cache')
+        self.svd = open_svd_file('test.svd').read()
+        with open(self.path, 'w') as file:
+            json.dump(DESCRIPTION, file)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def load(self, path=None, svd=None):
+        return load_description(self.dev, path or self.path, svd or self.svd,
+                                self.cache, {'pll': ext_get_freq})
+
+    def test_load_description(self):
+        self.dev.TEST1.TESTA.A3.write(1)
+        tree = self.load()
+        self.assertEqual(tree.peripherals, [self.dev.TEST1])
+        self.assertEqual(tree.get_freq('gate1'), 5432 // 2)
+        self.assertEqual(tree.get_freq('pll1'), 1234)
+        self.assertEqual(tree.get_freq('pll2'), 1234 * 2)
+        self.assertEqual(len(os.listdir(self.cache)), 1)
+
+        # The second load uses the cache, without parsing the description
+        with mock.patch('regiceclock.description.parse_description',
+                        side_effect=AssertionError):
+            tree = self.load()
+        self.assertEqual(tree.get_freq('gate1'), 5432 // 2)
+        with self.assertRaises(AssertionError):
+            with mock.patch('regiceclock.description.parse_description',
+                            side_effect=AssertionError):
+                self.load(svd=self.svd + ' ')
+
+    @unittest.skipIf(yaml is None, "PyYAML is not installed")
+    def test_load_yaml(self):
+        path = os.path.join(self.dir.name, 'clocks.yaml')
+        with open(path, 'w') as file:
+            yaml.safe_dump(DESCRIPTION, file)
+        self.dev.TEST1.TESTA.A3.write(0)
+        self.assertEqual(self.load(path).get_freq('gate1'), 1234)
+
+    def test_invalid_description(self):
+        clocks = DESCRIPTION['clocks']
+        invalid = [
+            {'type': 'unknown', 'name': 'clk'},
+            {'type': 'gate', 'name': 'clk', 'en_field': 'TEST1.TESTA.Z1'},
+            {'type': 'gate', 'name': 'clk', 'en': 'TEST1.TESTA.A1'},
+            {'type': 'gate', 'name': 'clk', 'parent': 'osc1'},
+            {'type': 'pll', 'name': 'clk', 'get_freq': 'unknown'},
+            {'type': 'fixed', 'name': 'osc1', 'freq': 1234},
+            {'type': 'gate', 'name': 'clk', 'parent': 'osc1', 'en_field': 3},
+            {'type': 'divider', 'name': 'clk', 'parent': 'osc1',
+             'get_div': 'pll', 'depends_on': 'TEST1.TESTA.A3'},
+        ]
+        for clock in invalid:
+            with open(self.path, 'w') as file:
+                json.dump({'clocks': clocks + [clock]}, file)
+            with self.assertRaises(InvalidDescription):
+                self.load()
+        with open(self.path, 'w') as file:
+            json.dump({'clocks': clocks, 'peripherals': [1]}, file)
+        with self.assertRaises(InvalidDescription):
+            self.load()
+        self.assertFalse(os.path.exists(self.cache))
+
+        # The cache is keyed on the SVD file, which is then required
+        with open(self.path, 'w') as file:
+            json.dump(DESCRIPTION, file)
+        with self.assertRaises(ValueError):
+            load_description(self.dev, self.path, cache_dir=self.cache)
+        load_description(self.dev, self.path,
+                         callbacks={'pll': ext_get_freq})
+
+    @unittest.skipIf(yaml is None, "PyYAML is not installed")
+    def test_invalid_yaml(self):
+        path = os.path.join(self.dir.name, 'clocks.yaml')
+        with open(path, 'w') as file:
+            file.write("clocks: [\n")
+        with self.assertRaises(InvalidDescription):
+            self.load(path)
+
+class BrokenClient(RegiceClientTest):
+    def read(self, *args, **kwargs):
+        raise IOError("The board is not responding")
+
+class TestFleet(ClockTestCase):
+    def make_board(self, client):
+        file = open_svd_file('test.svd')
+        svd = SVDText(file.read())
+        svd.parse()
+        dev = Device(svd, client)
+        tree = ClockTree(dev)
+        FixedClock(name='osc1', tree=tree, freq=1234)
+        Gate(name='gate1', tree=tree, parent='osc1',
+             en_field=dev.TEST1.TESTA.A1)
+        Divider(name='div1', tree=tree, parent='gate1',
+                div_field=dev.TEST1.TESTA.A3)
+        return tree, dev
+
+    def test_evaluate_fleet(self):
+        boards = [self.make_board(RegiceClientTest()) for _ in range(3)]
+        boards.append(self.make_board(BrokenClient()))
+        for _, dev in boards[:3]:
+            dev.TEST1.TESTA.A1.write(1)
+            dev.TEST1.TESTA.A3.write(0)
+        boards[1][1].TEST1.TESTA.A1.write(0)
+        boards[2][1].TEST1.TESTA.A3.write(2)
+
+        results = evaluate_fleet(boards, max_workers=2)
+        self.assertEqual([result.device for result in results],
+                         [dev for _, dev in boards])
+        self.assertEqual(results[0].gated, {})
+        self.assertEqual(results[1].gated, {'gate1': 'gate1', 'div1': 'gate1'})
+        self.assertEqual(results[2].freqs,
+                         {'osc1': 1234, 'gate1': 1234, 'div1': 1234 // 2})
+        self.assertIn('div1', results[0].errors)
+        for result in results[:3]:
+            self.assertIsNone(result.error)
+        self.assertIsInstance(results[3].error, IOError)
+
+        results = evaluate_fleet(boards[2:3], clocks=['div1'])
+        self.assertEqual(results[0].freqs['div1'], 1234 // 2)
+
+        tree, dev = boards[0]
+        with self.assertRaises(InvalidFleet):
+            evaluate_fleet([(tree, 'boardA')])
+        with self.assertRaises(InvalidFleet):
+            evaluate_fleet([(tree, dev), (tree, dev)])
+
+class TestBench(ClockTestCase):
+    def test_synthetic_tree(self):
+        tree = make_synthetic_tree(self.dev, clocks=200, depth=5, fan_in=3)
+        self.assertEqual(len(tree.clocks), 200)
+        self.assertEqual(len(tree.get_orphans()), 3)
+        freqs, errors = tree.compile().evaluate()
+        self.assertEqual(freqs, tree.evaluate()[0])
+        self.assertEqual({name: type(ex) for name, ex in errors.items()},
+                         {name: type(ex)
+                          for name, ex in tree.evaluate()[1].items()})
+        self.assertEqual(max(depth for depth, _, _, _, _ in tree.walk()), 5)
+
+    def test_run_benchmarks(self):
+        results = run_benchmarks(clocks=100)
+        self.assertEqual(list(results), OPERATIONS)
+        self.assertGreater(results['get_freq']['reads'], 0)
+        self.assertEqual(results['get_orphans']['reads'], 0)
+        self.assertGreater(results['prefetch']['reads'], 0)
+        self.assertLessEqual(results['prefetch_clocks']['reads'],
+                             results['prefetch']['reads'])
+        for result in results.values():
+            self.assertGreater(result['calls'], 0)
 
 def run_tests(module):
     return unittest.main(module=module, exit=False).result
@@ -41,6 +41,10 @@ setup(
         "Programming Language :: Python :: 3.6",
     ],
     install_requires=['LibRegice'],
+    extras_require={
+        'batch': ['numpy'],
+        'yaml': ['PyYAML'],
+    },
     dependency_links=[
         'git+https://github.com/BayLibre/libregice.git#egg=LibRegice',
     ],